@@ -0,0 +1,257 @@
+'''
+Fake GitHub API server for offline benchmarks of Labelord.
+
+Serves repositories and labels endpoints used by Labelord (including
+pagination, ETags, rate limit headers and GraphQL label queries) from
+memory, optionally with added latency and randomly injected errors.
+
+Run ``python benchmarks/fakegithub.py --help`` to start it on its own, point
+Labelord to it with ``api_url`` in *[github]* section of the configuration.
+'''
+import argparse
+import collections
+import hashlib
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+
+
+LABELS_URL = re.compile(r'^/repos/([^/]+/[^/]+)/labels(?:/([^/]+))?$')
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # http.server.ThreadingHTTPServer needs Python 3.7
+    daemon_threads = True
+
+
+class FakeGitHub:
+    '''
+    In-memory state of the fake API and the HTTP server serving it.
+
+    :param repos: Number of repositories, named *bench/repo0000* and so on.
+    :param labels: Number of labels of every repository.
+    :param latency: Number of seconds every response is delayed.
+    :param error_rate: Probability of answering a request with *502 Bad Gateway*.
+    :param rate_limit: Rate limit budget reported in *X-RateLimit-* headers.
+    :param seed: Seed of random error injection.
+    '''
+
+    def __init__(self, repos=100, labels=20, latency=0.0, error_rate=0.0, rate_limit=5000, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.repos = collections.OrderedDict()
+        for i in range(repos):
+            self.repos['bench/repo{:04d}'.format(i)] = collections.OrderedDict(
+                ('label{:03d}'.format(j), '{:06x}'.format(j * 997 % 0xffffff)) for j in range(labels))
+        self.stats = collections.Counter()
+        self.server = None
+        self.thread = None
+
+
+    @property
+    def url(self):
+        '''
+        Base URL of the running server.
+        '''
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+
+    def start(self, host='127.0.0.1', port=0):
+        '''
+        Starts the server in a background thread.
+
+        :param host: Address to listen on.
+        :param port: Port to listen on, 0 for any free port.
+        :return: Base URL of the server.
+        '''
+        handler = type('Handler', (Handler,), {'github': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+
+    def stop(self):
+        '''
+        Stops the server.
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def snapshot(self):
+        '''
+        Gets request counters.
+
+        :return: Dictionary of HTTP methods (and *total*) as keys and numbers of requests as values.
+        '''
+        with self.lock:
+            return dict(self.stats)
+
+
+    def count(self, method):
+        with self.lock:
+            self.stats[method] += 1
+            self.stats['total'] += 1
+            remaining = max(self.rate_limit - self.stats['total'], 0)
+            inject = self.error_rate > 0 and self.random.random() < self.error_rate
+        return remaining, inject
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    '''
+    Handles requests to the fake API, *github* is set to the :class:`FakeGitHub` instance.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    github = None
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def do_GET(self):
+        self.handle_api('GET')
+
+
+    def do_POST(self):
+        self.handle_api('POST')
+
+
+    def do_PATCH(self):
+        self.handle_api('PATCH')
+
+
+    def do_DELETE(self):
+        self.handle_api('DELETE')
+
+
+    def handle_api(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or 'null')
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/_stats':
+            return self.reply(200, self.github.snapshot())
+        remaining, inject = self.github.count(method)
+        if self.github.latency:
+            time.sleep(self.github.latency)
+        self.remaining = remaining
+        if inject:
+            return self.reply(502, {'message': 'Server Error'})
+        if not self.headers.get('Authorization'):
+            return self.reply(401, {'message': 'Bad credentials'})
+        if remaining == 0:
+            return self.reply(403, {'message': 'API rate limit exceeded'})
+        query = dict(urllib.parse.parse_qsl(url.query))
+        match = LABELS_URL.match(url.path)
+        if url.path == '/user/repos' and method == 'GET':
+            return self.reply_page(url.path, query, [{'full_name': repo} for repo in self.github.repos])
+        if url.path == '/graphql' and method == 'POST':
+            return self.reply(200, self.graphql(body['variables']))
+        if not match or match.group(1) not in self.github.repos:
+            return self.reply(404, {'message': 'Not Found'})
+        repo = match.group(1)
+        name = urllib.parse.unquote(match.group(2)) if match.group(2) else None
+        with self.github.lock:
+            labels = self.github.repos[repo]
+            if method == 'GET' and name is None:
+                items = [{'name': label, 'color': color} for label, color in labels.items()]
+            elif method == 'POST' and name is None:
+                if body['name'] in labels:
+                    return self.reply(422, {'message': 'Validation Failed'})
+                labels[body['name']] = body['color']
+                return self.reply(201, body)
+            elif method == 'PATCH' and name in labels:
+                del labels[name]
+                labels[body['name']] = body['color']
+                return self.reply(200, body)
+            elif method == 'DELETE' and name in labels:
+                del labels[name]
+                return self.reply(204, None)
+            else:
+                return self.reply(404, {'message': 'Not Found'})
+        self.reply_page(url.path, query, items)
+
+
+    def graphql(self, variables):
+        data = {}
+        errors = []
+        i = 0
+        with self.github.lock:
+            while 'owner{}'.format(i) in variables:
+                alias = 'r{}'.format(i)
+                repo = '{}/{}'.format(variables['owner{}'.format(i)], variables['name{}'.format(i)])
+                start = int(variables.get('after{}'.format(i)) or 0)
+                if repo in self.github.repos:
+                    items = list(self.github.repos[repo].items())
+                    data[alias] = {'labels': {
+                        'nodes': [{'name': label, 'color': color} for label, color in items[start:start + 100]],
+                        'pageInfo': {'hasNextPage': start + 100 < len(items), 'endCursor': str(start + 100)}}}
+                else:
+                    data[alias] = None
+                    errors.append({'type': 'NOT_FOUND', 'path': [alias], 'message': 'Could not resolve to a Repository'})
+                i += 1
+        return {'data': data, 'errors': errors} if errors else {'data': data}
+
+
+    def reply_page(self, path, query, items):
+        per_page = min(int(query.get('per_page', 30)), 100)
+        page = int(query.get('page', 1))
+        body = json.dumps(items[(page - 1) * per_page:page * per_page]).encode()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        headers = {'ETag': etag}
+        if page * per_page < len(items):
+            next_query = urllib.parse.urlencode(dict(query, page=page + 1))
+            headers['Link'] = '<{}{}?{}>; rel="next"'.format(self.github.url, path.lstrip('/'), next_query)
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, None, headers)
+        self.reply(200, body, headers)
+
+
+    def reply(self, code, body, headers=None):
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body or b'')))
+        self.send_header('X-RateLimit-Limit', str(self.github.rate_limit))
+        self.send_header('X-RateLimit-Remaining', str(getattr(self, 'remaining', self.github.rate_limit)))
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake GitHub API server for Labelord benchmarks.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--repos', type=int, default=100, help='number of repositories')
+    parser.add_argument('--labels', type=int, default=20, help='number of labels of every repository')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of every response in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of a 502 response')
+    parser.add_argument('--rate-limit', type=int, default=10 ** 9, help='rate limit budget')
+    args = parser.parse_args()
+    github = FakeGitHub(args.repos, args.labels, args.latency, args.error_rate, args.rate_limit)
+    print('Fake GitHub API listening on {}'.format(github.start(args.host, args.port)), flush=True)
+    try:
+        github.thread.join()
+    except KeyboardInterrupt:
+        github.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Import-time benchmark of the Labelord command line.
+
+Imports ``labelord.cli`` in fresh interpreters with ``python -X importtime``
+and reports the median cumulative import time of Labelord and of the
+heaviest modules it pulls in. Modules which must not be imported just to
+start the command line (Flask and requests) are checked as well, so the
+script can guard startup time in CI.
+
+Run ``python benchmarks/importtime.py --help`` for available options.
+'''
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+FORBIDDEN = ('flask', 'werkzeug', 'jinja2', 'requests')
+
+
+def measure(module):
+    '''
+    Imports the module in a fresh interpreter.
+
+    Only modules imported because of *module* are counted, not the ones
+    imported by the interpreter itself on startup.
+
+    :param module: Name of the module to be imported.
+    :return: Tuple of cumulative microseconds of the import and dictionary of top-level packages
+             imported by it as keys and their cumulative microseconds as values.
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total = 0
+    packages = {}
+    block = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        block.append((match.group(4), int(match.group(2))))
+        if len(match.group(3)) > 1:
+            continue
+        # a top-level import closes the block of everything it imported
+        if match.group(4).split('.')[0] == module.split('.')[0]:
+            total += int(match.group(2))
+            for name, cumulative in block:
+                top = name.split('.')[0]
+                packages[top] = max(packages.get(top, 0), cumulative)
+        block = []
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time benchmark of the Labelord command line.')
+    parser.add_argument('--module', default='labelord.cli', help='module to be imported')
+    parser.add_argument('--runs', type=int, default=5, help='number of measured imports')
+    parser.add_argument('--top', type=int, default=10, help='number of the heaviest modules to report')
+    parser.add_argument('--max-ms', type=float, help='exit with code 1 if the median import takes longer')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args()
+    runs = [measure(args.module) for i in range(args.runs)]
+    total = statistics.median(run[0] for run in runs) / 1000
+    packages = runs[0][1]
+    medians = {name: statistics.median(run[1].get(name, 0) for run in runs) / 1000 for name in packages}
+    forbidden = sorted(name for name in FORBIDDEN if name in packages)
+    heaviest = sorted(((ms, name) for name, ms in medians.items() if name != 'labelord'), reverse=True)[:args.top]
+    if args.json:
+        print(json.dumps({'module': args.module, 'ms': round(total, 3), 'forbidden': forbidden,
+                          'modules': {name: round(ms, 3) for ms, name in heaviest}}))
+    else:
+        print('{:<24} {:>9.1f} ms (median of {} runs)'.format(args.module, total, args.runs))
+        for ms, name in heaviest:
+            print('  {:<22} {:>9.1f} ms'.format(name, ms))
+        if forbidden:
+            print('imported but not needed to start: ' + ', '.join(forbidden))
+    failed = bool(forbidden) or args.max_ms is not None and total > args.max_ms
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
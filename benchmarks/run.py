@@ -0,0 +1,160 @@
+'''
+End-to-end benchmarks of Labelord against the fake GitHub API.
+
+Every scenario gets a fresh :class:`~fakegithub.FakeGitHub` server and runs
+Labelord in a separate process, exactly like users do. Wall time, number of
+requests received by the fake API and requests per second are reported.
+The script exits with code 1 when any scenario fails or takes longer than
+``--max-seconds``, so it can guard throughput in CI.
+
+Run ``python benchmarks/run.py --help`` for available options.
+'''
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+from fakegithub import FakeGitHub
+
+
+SCENARIOS = ['list_repos', 'list_labels', 'run', 'run_graphql', 'webhook']
+
+
+def write_config(path, github, args):
+    '''
+    Writes configuration pointing Labelord to the fake API.
+
+    Template labels are labels of the first repository with *changes* of them recolored,
+    so every repository needs *changes* updates.
+    '''
+    template = list(next(iter(github.repos.values())).items())
+    lines = ['[github]', 'token = bench', 'webhook_secret = bench', 'api_url = ' + github.url,
+             'mutations_per_minute = 0', 'concurrency = {}'.format(args.jobs), '',
+             '[server]', 'workers = 0', '', '[mirror]', 'enabled = off', '', '[repos]']
+    lines += ['{} = on'.format(repo) for repo in github.repos]
+    lines += ['', '[labels]']
+    lines += ['{} = {}'.format(name, 'ffffff' if i < args.changes else color) for i, (name, color) in enumerate(template)]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def labelord(config, *args, timeout=None):
+    command = [sys.executable, '-m', 'labelord', '-c', config, '--no-cache'] + list(args)
+    try:
+        return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout).returncode
+    except subprocess.TimeoutExpired:
+        return 'timeout'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def webhook(config, github, args):
+    '''
+    Starts the web application and sends it label webhooks, every one of them
+    is propagated to all other repositories before it's answered.
+    '''
+    port = free_port()
+    url = 'http://127.0.0.1:{}/'.format(port)
+    env = dict(os.environ, LABELORD_CONFIG=config)
+    server = subprocess.Popen([sys.executable, '-m', 'labelord', '-c', config, 'run-server', '-p', str(port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for attempt in range(100):
+            try:
+                requests.get(url)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        repo = next(iter(github.repos))
+        start = time.monotonic()
+        before = github.snapshot().get('total', 0)
+        code = 0
+        for i in range(args.events):
+            payload = json.dumps({'action': 'created', 'label': {'name': 'bench{}'.format(i), 'color': 'ff0000'},
+                                  'repository': {'full_name': repo}}).encode()
+            signature = 'sha1=' + hmac.new(b'bench', payload, hashlib.sha1).hexdigest()
+            response = requests.post(url, data=payload, headers={'X-GitHub-Event': 'label', 'X-Hub-Signature': signature,
+                                                                 'X-GitHub-Delivery': 'bench{}'.format(i),
+                                                                 'Content-Type': 'application/json'})
+            if response.status_code != 200:
+                code = response.status_code
+        return time.monotonic() - start, github.snapshot().get('total', 0) - before, code
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_scenario(name, args, directory):
+    '''
+    Runs one scenario against a fresh fake API.
+
+    :return: Dictionary with scenario, seconds, requests, requests_per_second and exit code.
+    '''
+    github = FakeGitHub(args.repos, args.labels, args.latency, args.error_rate, args.rate_limit)
+    github.start()
+    config = os.path.join(directory, name + '.cfg')
+    write_config(config, github, args)
+    jobs = ['--jobs', str(args.jobs)]
+    try:
+        if name == 'webhook':
+            seconds, count, code = webhook(config, github, args)
+        else:
+            command = {
+                'list_repos': ['list-repos'],
+                'list_labels': ['list-labels', next(iter(github.repos))],
+                'run': ['run', 'update'] + jobs,
+                'run_graphql': ['run', 'update', '--backend', 'graphql'] + jobs,
+            }[name]
+            start = time.monotonic()
+            code = labelord(config, *command, timeout=args.max_seconds)
+            seconds = time.monotonic() - start
+            count = github.snapshot().get('total', 0)
+    finally:
+        github.stop()
+    return {'scenario': name, 'seconds': round(seconds, 3), 'requests': count,
+            'requests_per_second': round(count / seconds, 1) if seconds else 0.0, 'exit_code': code}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmarks of Labelord against a fake GitHub API.')
+    parser.add_argument('scenarios', nargs='*', choices=SCENARIOS + [[]], help='scenarios to run, all by default')
+    parser.add_argument('--repos', type=int, default=1000, help='number of repositories')
+    parser.add_argument('--labels', type=int, default=200, help='number of labels of every repository')
+    parser.add_argument('--changes', type=int, default=5, help='number of labels to be updated in every repository')
+    parser.add_argument('--events', type=int, default=3, help='number of webhooks sent to the web application')
+    parser.add_argument('--jobs', type=int, default=8, help='value of --jobs and [github] concurrency')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of every response of the fake API in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of a 502 response of the fake API')
+    parser.add_argument('--rate-limit', type=int, default=100000, help='rate limit budget of the fake API')
+    parser.add_argument('--max-seconds', type=float, help='exit with code 1 if any scenario takes longer, it is killed then')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+    failed = []
+    with tempfile.TemporaryDirectory() as directory:
+        if not args.json:
+            print('{:<12} {:>9} {:>9} {:>9} {:>5}'.format('scenario', 'seconds', 'requests', 'req/s', 'exit'))
+        for name in args.scenarios or SCENARIOS:
+            result = run_scenario(name, args, directory)
+            if args.json:
+                print(json.dumps(result), flush=True)
+            else:
+                print('{scenario:<12} {seconds:>9.3f} {requests:>9} {requests_per_second:>9.1f} {exit_code:>5}'.format(**result), flush=True)
+            if result['exit_code'] != 0 or (args.max_seconds is not None and result['seconds'] > args.max_seconds):
+                failed.append(name)
+    if failed:
+        print('Failed scenarios: ' + ', '.join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,17 @@
+import sys
+import types
 from .cli import cli
-from .web import app
 
 __all__ = ['cli']
+
+
+class _Package(types.ModuleType):
+    # the web application is created on first access, so importing the package stays fast;
+    # a module subclass instead of module __getattr__, which needs Python 3.7
+    @property
+    def app(self):
+        from .web import app
+        return app
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,136 @@
+import collections
+import csv
+import json
+
+
+FIELDS = ('missing', 'wrong', 'extra')
+
+
+class DriftReport:
+    '''
+    Aggregated drift of repository labels from their templates.
+
+    Drift is taken from plans computed in replace mode: labels to be added are
+    *missing*, labels to be updated (different color or letter case) are *wrong*
+    and labels to be deleted are *extra*. Drift score of a repository is the
+    number of its labels in any of these states.
+
+    :ivar listing_errors: Number of repository listings which failed part way through, so the report is incomplete.
+    '''
+
+    def __init__(self):
+        self.labels = collections.OrderedDict()
+        self.repos = []
+        self.listing_errors = 0
+
+
+    def add(self, plan):
+        '''
+        Adds drift of one repository.
+
+        :param plan: :class:`~labelord.plan.RepoPlan` computed in replace mode.
+        '''
+        row = {'repo': plan.repo, 'missing': len(plan.adds), 'wrong': len(plan.updates), 'extra': len(plan.deletes)}
+        row['score'] = row['missing'] + row['wrong'] + row['extra']
+        row['error'] = False
+        for label, color in plan.adds:
+            self._count(label, 'missing')
+        for current, label, color in plan.updates:
+            self._count(label, 'wrong')
+        for label, color in plan.deletes:
+            self._count(label, 'extra')
+        self.repos.append(row)
+
+
+    def add_error(self, repo):
+        '''
+        Adds repository whose labels couldn't be read.
+
+        :param repo: Full repository name.
+        '''
+        self.repos.append({'repo': repo, 'missing': 0, 'wrong': 0, 'extra': 0, 'score': 0, 'error': True})
+
+
+    def _count(self, label, field):
+        row = self.labels.get(label.casefold())
+        if row is None:
+            row = self.labels[label.casefold()] = {'label': label, 'missing': 0, 'wrong': 0, 'extra': 0}
+        row[field] += 1
+
+
+    def label_rows(self):
+        '''
+        Gets drift of every label, the most drifting first.
+
+        :return: List of dictionaries with label, missing, wrong and extra keys.
+        '''
+        return sorted(self.labels.values(), key=lambda row: (-sum(row[field] for field in FIELDS), row['label'].casefold()))
+
+
+    def repo_rows(self):
+        '''
+        Gets drift of every repository, the most drifting first, unreadable repositories last.
+
+        :return: List of dictionaries with repo, missing, wrong, extra, score and error keys.
+        '''
+        return sorted(self.repos, key=lambda row: (row['error'], -row['score'], row['repo']))
+
+
+    def summary(self):
+        '''
+        Summarizes the report.
+
+        :return: Dictionary with numbers of repos, drifting repos, unreadable repos, drifting labels and failed listings.
+        '''
+        return {'repos': len(self.repos), 'drifting': sum(row['score'] > 0 for row in self.repos),
+                'errors': sum(row['error'] for row in self.repos), 'labels': len(self.labels), 'listing_errors': self.listing_errors}
+
+
+    def write(self, stream, format='table'):
+        '''
+        Writes the report.
+
+        :param stream: Text stream.
+        :param format: *table* for human readable tables, *json* or *csv* with *kind* column telling labels and repos apart.
+        '''
+        if format == 'json':
+            json.dump({'summary': self.summary(), 'labels': self.label_rows(), 'repos': self.repo_rows()}, stream, indent=1)
+            stream.write('\n')
+        elif format == 'csv':
+            writer = csv.writer(stream, lineterminator='\n')
+            writer.writerow(['kind', 'name', 'missing', 'wrong', 'extra', 'score', 'error'])
+            for row in self.label_rows():
+                writer.writerow(['label', row['label'], row['missing'], row['wrong'], row['extra'], sum(row[field] for field in FIELDS), ''])
+            for row in self.repo_rows():
+                writer.writerow(['repo', row['repo'], row['missing'], row['wrong'], row['extra'], row['score'], int(row['error'])])
+        else:
+            stream.write(self.table())
+
+
+    def table(self):
+        '''
+        Formats the report as human readable tables.
+
+        :return: String with table of labels, table of repositories and summary line.
+        '''
+        labels = self.label_rows()
+        repos = self.repo_rows()
+        width = max([len('LABEL'), len('REPO')] + [len(row['label']) for row in labels] + [len(row['repo']) for row in repos])
+        line = '{:<' + str(width) + '} {:>7} {:>7} {:>7} {:>7}'
+        lines = [line.format('LABEL', 'MISSING', 'WRONG', 'EXTRA', 'TOTAL')]
+        for row in labels:
+            lines.append(line.format(row['label'], row['missing'], row['wrong'], row['extra'], sum(row[field] for field in FIELDS)))
+        lines += ['', line.format('REPO', 'MISSING', 'WRONG', 'EXTRA', 'SCORE')]
+        for row in repos:
+            if row['error']:
+                lines.append(line.format(row['repo'], '-', '-', '-', 'ERR'))
+            else:
+                lines.append(line.format(row['repo'], row['missing'], row['wrong'], row['extra'], row['score']))
+        summary = self.summary()
+        text = '{drifting} of {repos} repo(s) drift from the template, {labels} label(s) affected'.format(**summary)
+        if summary['errors']:
+            text += ', {errors} repo(s) couldn\'t be read'.format(**summary)
+        if summary['listing_errors']:
+            text += ', listing of repositories failed so the report is incomplete'
+        lines += ['', text]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,214 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+import requests
+import requests.adapters
+import requests.structures
+
+
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+
+def default_directory():
+    '''
+    Gets default directory of the cache.
+
+    :return: Path of *labelord* directory in user's cache directory.
+    '''
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'labelord')
+
+
+class ResponseCache:
+    '''
+    On-disk cache of GitHub API responses with ETag or Last-Modified validators.
+
+    Every entry is stored in its own JSON file, least recently used entries
+    are removed when total size of the cache exceeds *max_size*.
+
+    :ivar hits: Number of responses revalidated with 304 status code.
+    :ivar misses: Number of cacheable requests not answered from the cache.
+    '''
+
+    def __init__(self, directory, max_size=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[:-5], stat.st_size))
+        for mtime, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+
+
+    @staticmethod
+    def key(request):
+        '''
+        Computes cache key of the request.
+
+        Authorization header is part of the key, so responses are never shared between tokens.
+
+        :param request: Prepared request.
+        :return: Hexadecimal digest identifying the request.
+        '''
+        identity = '{} {}'.format(request.url, request.headers.get('Authorization', ''))
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+
+    def get(self, key):
+        '''
+        Gets cached entry and marks it as recently used.
+
+        :param key: Cache key.
+        :return: Dictionary with headers and body keys or None if there is no such entry.
+        '''
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            self.discard(key)
+            return None
+        return entry
+
+
+    def set(self, key, response):
+        '''
+        Stores the response in the cache and evicts least recently used entries if needed.
+
+        :param key: Cache key.
+        :param response: Response with ETag or Last-Modified header.
+        '''
+        entry = {
+            'url': response.url,
+            'headers': {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers},
+            'body': response.text,
+        }
+        data = json.dumps(entry)
+        if len(data) > self.max_size:
+            return
+        path = self._path(key)
+        tmppath = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(tmppath, 'w') as f:
+            f.write(data)
+        os.replace(tmppath, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._size > self.max_size:
+                old, size = self._entries.popitem(last=False)
+                self._size -= size
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+
+    def record(self, hit):
+        '''
+        Updates hit and miss counters.
+
+        :param hit: True if the response was answered from the cache.
+        '''
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+    def discard(self, key):
+        '''
+        Removes entry from the cache.
+
+        :param key: Cache key.
+        '''
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class CachingAdapter(requests.adapters.HTTPAdapter):
+    '''
+    Transport adapter revalidating GET requests with cached ETag and Last-Modified values.
+
+    Responses with 304 status code are turned back into the cached 200 responses.
+    Requests which already contain conditional headers are sent unchanged.
+    '''
+
+    def __init__(self, cache, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET' or 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers:
+            return super().send(request, **kwargs)
+        key = self.cache.key(request)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if 'ETag' in entry['headers']:
+                request.headers['If-None-Match'] = entry['headers']['ETag']
+            if 'Last-Modified' in entry['headers']:
+                request.headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.record(True)
+            # read the empty body, so the connection goes back to the pool instead of being dropped
+            response.content
+            response.close()
+            return self.build_cached(request, response, entry)
+        self.cache.record(False)
+        if response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+            self.cache.set(key, response)
+        elif entry is not None:
+            self.cache.discard(key)
+        return response
+
+
+    @staticmethod
+    def build_cached(request, revalidation, entry):
+        '''
+        Builds response from the cache entry.
+
+        :param request: Prepared request.
+        :param revalidation: Response with 304 status code.
+        :param entry: Cache entry.
+        :return: Response with 200 status code.
+        '''
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = requests.structures.CaseInsensitiveDict(revalidation.headers)
+        response.headers.pop('Content-Encoding', None)
+        response.headers.pop('Content-Length', None)
+        response.headers.update(entry['headers'])
+        response._content = entry['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.elapsed = revalidation.elapsed
+        response.connection = revalidation.connection
+        response.from_cache = True
+        return response
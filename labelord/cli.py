@@ -1,43 +1,54 @@
 import click
 import configparser
-import requests
-from .web import *
-from .helpers import *
-from .github import *
+import os
+from .helpers import error
+from .metrics import EventSink, set_sink
+from .profile import Profiler, set_profiler, span
+
+# Modules depending on requests and Flask are imported by the commands which
+# need them, so the command line starts fast and --help doesn't load them.
 
 
 @click.group('labelord')
 @click.option('-c', '--config', default='./config.cfg', envvar='LABELORD_CONFIG', help='Configuration file path.')
 @click.option('-t', '--token', envvar='GITHUB_TOKEN', default='', help='GitHub token.')
+@click.option('--no-cache', is_flag=True, help='Don\'t use cache of GitHub responses.')
+@click.option('--log-json', type=click.File('w', lazy=False), help='File to write structured events to as JSON lines, - for standard output.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='File to write Chrome trace of the run to.')
+@click.option('--profile-top', default=10, type=click.IntRange(0, None), help='Number of the slowest requests to report with --profile.')
 @click.version_option(version=0.5, prog_name='labelord')
 @click.pass_context
-def cli(ctx, config, token):
+def cli(ctx, config, token, no_cache, log_json, profile, profile_top):
+    if profile:
+        profiler = Profiler()
+        set_profiler(profiler)
+        ctx.call_on_close(lambda: finish_profile(profiler, profile, profile_top))
     cfg = configparser.ConfigParser()
     cfg.optionxform = str
-    cfg.read(config)
+    with span('config', 'config', path=config):
+        cfg.read(config)
     cfgtoken = cfg.get('github', 'token', fallback='')
     ctx.obj['token'] = token if token else cfgtoken
     ctx.obj['config'] = cfg
     ctx.obj['configpath'] = config
+    ctx.obj['cache'] = not no_cache and cfg.getboolean('cache', 'enabled', fallback=True)
+    if log_json:
+        sink = EventSink(log_json)
+        set_sink(sink)
+        ctx.call_on_close(sink.flush)
 
 
 @cli.command()
 @click.pass_context
 def list_repos(ctx):
     """List accessible repositories."""
-    set_session()
-    page = 1
-    response, code = get_response('user/repos?per_page=100&page={}'.format(page))
-    if code == 200:
-        while response.json():
-            for repo in response.json():
-                print(repo['full_name'])
-            if len(response.json()) < 100:
-                break
-            page += 1
-            response, code = get_response('user/repos?per_page=100&page={}'.format(page))
-    else:
-        error(10)
+    from .github import iter_pages
+    session = set_session()
+    for response, code in iter_pages(session, 'user/repos?per_page=100', True):
+        if code != 200:
+            error(10)
+        for repo in response.json():
+            print(repo['full_name'])
 
 
 @cli.command()
@@ -45,21 +56,21 @@ def list_repos(ctx):
 @click.pass_context
 def list_labels(ctx, reposlug):
     """List labels of desired repository."""
-    set_session()
-    page = 1
-    response, code = get_response('repos/{}/labels?per_page=100&page={}'.format(reposlug, page))
-    if code == 200:
-        while response.json():
-            for label in response.json():
-                print('#{} {}'.format(label['color'], label['name']))
-            if len(response.json()) < 100:
-                break
-            page += 1
-            response, code = get_response('repos/{}/labels?per_page=100&page={}'.format(reposlug, page))
-    elif code == 404:
-        error(5, 'GitHub: ERROR {} - {}'.format('404', response.json().get('message', '')))
-    else:
-        error(10)
+    from .github import iter_pages
+    session = set_session()
+    labels, pages = {}, []
+    for response, code in iter_pages(session, 'repos/{}/labels?per_page=100'.format(reposlug), True):
+        if code == 404:
+            error(5, 'GitHub: ERROR {} - {}'.format('404', response.json().get('message', '')))
+        elif code != 200:
+            error(10)
+        pages.append((response.url, response.headers.get('ETag', '')))
+        for label in response.json():
+            labels[label['name']] = label['color']
+            print('#{} {}'.format(label['color'], label['name']))
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.store(reposlug, labels, pages)
 
 
 @cli.command()
@@ -69,16 +80,108 @@ def list_labels(ctx, reposlug):
 @click.option('-v', '--verbose', is_flag=True, help='Turns on logs on standard output.')
 @click.option('-q', '--quiet', is_flag=True, help='Turns off all logs.')
 @click.option('-r', '--template-repo', default='', help='Repository to use as a template.')
+@click.option('-j', '--jobs', default=1, type=click.IntRange(1, None), help='Number of repositories processed concurrently.')
+@click.option('-i', '--incremental', is_flag=True, help='Use mirrored labels of repositories which haven\'t changed.')
+@click.option('-b', '--backend', type=click.Choice(['rest', 'graphql']), help='API used to read labels of repositories.')
+@click.option('-g', '--group', multiple=True, help='Synchronize only this group of repositories, can be repeated.')
+@click.option('--resume', is_flag=True, help='Skip repositories finished by the interrupted run.')
+@click.option('--journal', type=click.Path(dir_okay=False, writable=True), help='File to record progress of the run to.')
 @click.pass_context
-def run(ctx, mode, all_repos, dry_run, verbose, quiet, template_repo):
+def run(ctx, mode, all_repos, dry_run, verbose, quiet, template_repo, jobs, incremental, backend, group, resume, journal):
     """Run labels processingpython -m pip install --extra-index-url https://test.pypi.org/pypi labelord_klememi1"""
-    session = set_session()
-    config = ctx.obj.get('config')
-    template_repository = template_repo if template_repo else config.get('others', 'template-repo', fallback='')
-    labels = get_labels(template_repository, config)
-    repos = get_repos(all_repos, config)
+    from .github import perform_operation
+    session = set_session(jobs)
+    labels, repos = get_targets(template_repo, all_repos, group)
+    logging = 1 if verbose and not quiet else 2 if quiet and not verbose else 0
+    renames = get_renames()
+    journal = None if dry_run else get_journal(journal, resume, mode, labels, renames)
+    if journal is not None:
+        if journal.mismatch and logging != 2:
+            click.echo('Settings changed since the interrupted run, starting from the beginning', err=True)
+        repos = journal.pending(repos)
+    reader = get_reader(backend)
+    if reader is not None:
+        repos = reader.stream(session, repos, get_mirror_skip(incremental))
+    perform_operation(True if mode == 'replace' else False, repos, labels, dry_run, logging, session, jobs, get_mirror(), incremental,
+                      reader, renames, journal)
+
+
+@cli.command()
+@click.argument('mode', type=click.Choice(['update', 'replace']), metavar='<update|replace>')
+@click.option('-o', '--output', default='plan.json', type=click.Path(dir_okay=False, writable=True), help='File to save the plan to.')
+@click.option('-a', '--all-repos', is_flag=True, help='Use all accessible repositories.')
+@click.option('-v', '--verbose', is_flag=True, help='Turns on logs on standard output.')
+@click.option('-q', '--quiet', is_flag=True, help='Turns off all logs.')
+@click.option('-r', '--template-repo', default='', help='Repository to use as a template.')
+@click.option('-j', '--jobs', default=1, type=click.IntRange(1, None), help='Number of repositories processed concurrently.')
+@click.option('-b', '--backend', type=click.Choice(['rest', 'graphql']), help='API used to read labels of repositories.')
+@click.option('-g', '--group', multiple=True, help='Synchronize only this group of repositories, can be repeated.')
+@click.pass_context
+def plan(ctx, mode, output, all_repos, verbose, quiet, template_repo, jobs, backend, group):
+    """Save changes needed to synchronize labels to a file"""
+    from .github import create_plans, summarize
+    from .plan import save_plans
+    session = set_session(jobs)
+    labels, repos = get_targets(template_repo, all_repos, group)
     logging = 1 if verbose and not quiet else 2 if quiet and not verbose else 0
-    perform_operation(True if mode == 'replace' else False, repos, labels, dry_run, logging, session)
+    replace = True if mode == 'replace' else False
+    reader = get_reader(backend)
+    if reader is not None:
+        repos = reader.stream(session, repos)
+    plans, errors = create_plans(replace, repos, labels, logging, session, jobs, get_mirror(), reader, get_renames())
+    save_plans(output, replace, labels, plans)
+    if logging == 1 and getattr(session, 'scheduler', None):
+        print('[SUMMARY] {}'.format(session.scheduler.summary()))
+    if errors > 0:
+        summarize(errors, len(plans), logging)
+    elif logging == 1:
+        print('[SUMMARY] {} operation(s) planned in {} repo(s)'.format(sum(len(plan) for plan in plans), len(plans)))
+    elif logging == 0:
+        print('SUMMARY: {} operation(s) planned in {} repo(s)'.format(sum(len(plan) for plan in plans), len(plans)))
+
+
+@cli.command()
+@click.argument('planfile', type=click.Path(exists=True, dir_okay=False), metavar='PLAN')
+@click.option('-d', '--dry-run', is_flag=True, help='Doesn\'t make any changes to GitHub, just prints them.')
+@click.option('-v', '--verbose', is_flag=True, help='Turns on logs on standard output.')
+@click.option('-q', '--quiet', is_flag=True, help='Turns off all logs.')
+@click.option('-j', '--jobs', default=1, type=click.IntRange(1, None), help='Number of repositories processed concurrently.')
+@click.pass_context
+def apply(ctx, planfile, dry_run, verbose, quiet, jobs):
+    """Perform changes saved by the plan command"""
+    from .github import apply_plans
+    from .plan import load_plans
+    session = set_session(jobs)
+    try:
+        replace, labels, plans = load_plans(planfile)
+    except (ValueError, KeyError) as e:
+        error(11, 'Invalid plan file: {}'.format(e))
+    logging = 1 if verbose and not quiet else 2 if quiet and not verbose else 0
+    apply_plans(plans, replace, labels, dry_run, logging, session, jobs, get_mirror(), get_renames())
+
+
+@cli.command()
+@click.option('-a', '--all-repos', is_flag=True, help='Use all accessible repositories.')
+@click.option('-r', '--template-repo', default='', help='Repository to use as a template.')
+@click.option('-g', '--group', multiple=True, help='Audit only this group of repositories, can be repeated.')
+@click.option('-j', '--jobs', default=1, type=click.IntRange(1, None), help='Number of repositories read concurrently.')
+@click.option('-i', '--incremental', is_flag=True, help='Use mirrored labels of repositories which haven\'t changed.')
+@click.option('-b', '--backend', type=click.Choice(['rest', 'graphql']), help='API used to read labels of repositories.')
+@click.option('-f', '--format', 'output_format', default='table', type=click.Choice(['table', 'json', 'csv']), help='Format of the report.')
+@click.option('-o', '--output', default='-', type=click.File('w'), help='File to write the report to, standard output by default.')
+@click.pass_context
+def audit(ctx, all_repos, template_repo, group, jobs, incremental, backend, output_format, output):
+    """Report drift of repository labels from the template"""
+    from .github import audit_repos
+    session = set_session(jobs)
+    labels, repos = get_targets(template_repo, all_repos, group)
+    reader = get_reader(backend)
+    if reader is not None:
+        repos = reader.stream(session, repos, get_mirror_skip(incremental))
+    report = audit_repos(repos, labels, session, jobs, get_mirror(), incremental, reader, get_renames())
+    report.write(output, output_format)
+    if report.summary()['errors'] or report.listing_errors:
+        error(10)
 
 
 @cli.command()
@@ -86,27 +189,103 @@ def run(ctx, mode, all_repos, dry_run, verbose, quiet, template_repo):
 @click.option('--host', '-h', default='127.0.0.1', help='Hostname.')
 @click.option('--port', '-p', default=5000, help='Port.')
 @click.option('--debug', '-d', is_flag=True, envvar='FLASK_DEBUG', help='Debug mode.')
-def run_server(ctx, host, port, debug):
+@click.option('--workers', '-w', default=1, type=click.IntRange(1, None), help='Number of server processes sharing state.')
+def run_server(ctx, host, port, debug, workers):
     """Start local server app"""
-    app.lblconfig = ctx.obj['config']
-    # app.ghsession = ctx.obj['session']
-    check_config(app.lblconfig)
-    app.run(host=host, port=port, debug=debug)
+    from .server import serve
+    from .web import app
+    app.configpath = ctx.obj['configpath']
+    app.reload_config()
+    if workers == 1:
+        app.run(host=host, port=port, debug=debug)
+        return
+    if debug:
+        error(12, 'Debug mode can\'t be used with multiple workers')
+    if not hasattr(os, 'fork'):
+        error(12, 'Multiple workers are supported only on POSIX systems')
+    app.prepare_workers()
+    serve(app, host, port, workers, app.start_worker, app.worker_exited)
 
 
 @click.pass_context
-def set_session(ctx):
-    session = ctx.obj.get('session', requests.Session())
-    session.headers = {'User-Agent': 'mi-pyt-01-labelord'}
+def set_session(ctx, pool_size=10):
+    from .cache import ResponseCache, default_directory
+    from .session import configure_session, create_session
     github_token = ctx.obj.get('token')
     if not github_token:
         error(3, 'No GitHub token has been provided')
-    def token_auth(req):
-        req.headers['Authorization'] = 'token ' + github_token
-        return req
-    session.auth = token_auth
-    ctx.obj['session'] = session
-    return session
+    if 'session' in ctx.obj:
+        return configure_session(ctx.obj['session'], github_token, 'mi-pyt-01-labelord')
+    config = ctx.obj['config']
+    cache = None
+    if ctx.obj.get('cache'):
+        directory = os.path.expanduser(config.get('cache', 'directory', fallback='')) or default_directory()
+        max_size = config.getint('cache', 'max_size', fallback=50) * 1024 * 1024
+        cache = ResponseCache(directory, max_size)
+    ctx.obj['session'] = create_session(github_token, 'mi-pyt-01-labelord', config, cache, max(pool_size, 10))
+    return ctx.obj['session']
+
+
+@click.pass_context
+def get_targets(ctx, template_repo, all_repos, groups):
+    from .github import get_group_templates, get_labels, get_repos
+    config = ctx.obj['config']
+    if not template_repo and not all_repos:
+        templates = get_group_templates(config, groups)
+        if templates is not None:
+            return templates, templates.repos()
+    if groups:
+        error(7, 'No groups of repositories have been found')
+    template_repository = template_repo if template_repo else config.get('others', 'template-repo', fallback='')
+    return get_labels(template_repository, config), get_repos(all_repos, config)
+
+
+def finish_profile(profiler, path, top):
+    profiler.write(path)
+    click.echo(profiler.report(top), err=True)
+
+
+@click.pass_context
+def get_mirror(ctx):
+    from .cache import default_directory
+    from .mirror import LabelMirror
+    if 'mirror' not in ctx.obj:
+        ctx.obj['mirror'] = LabelMirror.from_config(ctx.obj['config'], default_directory())
+    return ctx.obj['mirror']
+
+
+def get_mirror_skip(incremental):
+    mirror = get_mirror()
+    if not incremental or mirror is None:
+        return None
+    return mirror.has_recent
+
+
+@click.pass_context
+def get_renames(ctx):
+    from .plan import load_renames
+    return load_renames(ctx.obj['config'])
+
+
+@click.pass_context
+def get_journal(ctx, path, resume, mode, labels, renames):
+    from .cache import default_directory
+    from .groups import GroupTemplates
+    from .journal import Journal, fingerprint
+    template = labels.to_dict() if isinstance(labels, GroupTemplates) else labels
+    if not path:
+        name = fingerprint(os.path.abspath(ctx.obj['configpath']), mode)[:16]
+        path = os.path.join(default_directory(), 'journals', name + '.jsonl')
+    return Journal(path, fingerprint(mode, template, renames), resume)
+
+
+@click.pass_context
+def get_reader(ctx, backend):
+    config = ctx.obj['config']
+    if (backend or config.get('github', 'backend', fallback='rest')) != 'graphql':
+        return None
+    from .graphql import GraphQLReader
+    return GraphQLReader(batch_size=config.getint('github', 'graphql_batch_size', fallback=50))
 
 
 def main():
@@ -0,0 +1,91 @@
+import threading
+
+
+def coalesce(events):
+    '''
+    Collapses chains of label events into net changes.
+
+    Label created and deleted afterwards disappears, label deleted and created
+    again becomes edited, consecutive edits become a single edit from the
+    original name to the final name and color.
+
+    :param events: List of dictionaries with event, label, color, old_label and repo keys in order of receiving.
+    :return: List of dictionaries with event, label, color, old_label and skip keys, skip is a list
+             with the repository the last event of the chain came from, which already has the final state.
+    '''
+    chains = {}
+    order = []
+    for item in events:
+        event = item['event']
+        key = (item['old_label'] if event == 'edited' else item['label']).casefold()
+        chain = chains.pop(key, None)
+        if chain is None:
+            chain = {'initial': None if event == 'created' else item['old_label'], 'deleted': False}
+            order.append(chain)
+        chain['origin'] = item['repo']
+        if event != 'deleted':
+            chain.update(deleted=False, label=item['label'], color=item['color'])
+            chains[item['label'].casefold()] = chain
+        elif chain['initial'] is None:
+            order.remove(chain)
+        else:
+            chain['deleted'] = True
+            chains[key] = chain
+    changes = []
+    for chain in order:
+        skip = [chain['origin']]
+        if chain['initial'] is None:
+            changes.append({'event': 'created', 'label': chain['label'], 'color': chain['color'], 'old_label': chain['label'], 'skip': skip})
+        elif chain['deleted']:
+            changes.append({'event': 'deleted', 'label': chain['initial'], 'color': '', 'old_label': chain['initial'], 'skip': skip})
+        else:
+            changes.append({'event': 'edited', 'label': chain['label'], 'color': chain['color'], 'old_label': chain['initial'], 'skip': skip})
+    return changes
+
+
+class Coalescer:
+    '''
+    Buffers label events for a short window and passes their net changes on.
+
+    The window starts with the first event added to an empty buffer.
+
+    :param flush: Function called with list of changes computed by :func:`coalesce`.
+    :param window: Number of seconds events are buffered for.
+    '''
+
+    def __init__(self, flush, window):
+        self.flush = flush
+        self.window = window
+        self._lock = threading.Lock()
+        self._events = []
+        self._timer = None
+
+
+    def add(self, event, label, color, old_label, repo):
+        '''
+        Adds an event to the buffer.
+
+        :param event: String describing event, can be *created*, *edited* or *deleted*.
+        :param label: Label name.
+        :param color: Label color.
+        :param old_label: Name of the label before the event.
+        :param repo: Full name of the repository the event came from.
+        '''
+        with self._lock:
+            self._events.append({'event': event, 'label': label, 'color': color, 'old_label': old_label, 'repo': repo})
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.drain)
+                self._timer.daemon = True
+                self._timer.start()
+
+
+    def drain(self):
+        '''
+        Passes net changes of buffered events on and empties the buffer.
+        '''
+        with self._lock:
+            events, self._events = self._events, []
+            self._timer = None
+        changes = coalesce(events)
+        if changes:
+            self.flush(changes)
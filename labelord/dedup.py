@@ -0,0 +1,146 @@
+import collections
+import sqlite3
+import threading
+import time
+
+
+ABSENT = 'absent'
+
+
+class MemoryDedupStore:
+    '''
+    Remembers recently seen keys and latest states of labels in memory of the process.
+
+    Keys and states expire after their time to live, at most *max_size* of
+    each are kept, the oldest ones are forgotten first.
+
+    :param max_size: Maximal number of remembered keys.
+    '''
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._keys = collections.OrderedDict()
+        self._states = collections.OrderedDict()
+
+
+    def seen(self, key, ttl):
+        '''
+        Checks if the key has been seen and remembers it.
+
+        :param key: String to be checked.
+        :param ttl: Number of seconds the key should be remembered for.
+        :return: True if the key has been seen and hasn't expired yet, False otherwise.
+        '''
+        now = time.time()
+        with self._lock:
+            expires = self._keys.get(key)
+            if expires is not None and expires > now:
+                return True
+            self._keys.pop(key, None)
+            self._keys[key] = now + ttl
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+            return False
+
+
+    def update_states(self, states, ttl):
+        '''
+        Checks if labels are in the given states and remembers the states as the latest ones.
+
+        :param states: Dictionary of label keys as keys and their states as values, see :func:`label_states`.
+        :param ttl: Number of seconds the states should be remembered for.
+        :return: True if every label has already been in its state and it hasn't expired yet, False otherwise.
+        '''
+        now = time.time()
+        with self._lock:
+            current = True
+            for key, state in states.items():
+                remembered = self._states.get(key)
+                if remembered is None or remembered[1] <= now or remembered[0] != state:
+                    current = False
+            if current:
+                return True
+            for key, state in states.items():
+                self._states.pop(key, None)
+                self._states[key] = (state, now + ttl)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+            return False
+
+
+class SQLiteDedupStore:
+    '''
+    Remembers recently seen keys and latest states of labels in a SQLite database shared by multiple processes.
+
+    :param path: Path of the database file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS dedup (key TEXT PRIMARY KEY, expires REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS dedup_expires ON dedup (expires)')
+            db.execute('CREATE TABLE IF NOT EXISTS states (key TEXT PRIMARY KEY, state TEXT, expires REAL)')
+
+
+    def _connect(self):
+        if not hasattr(self._local, 'db'):
+            self._local.db = sqlite3.connect(self.path, timeout=30)
+        return self._local.db
+
+
+    def seen(self, key, ttl):
+        '''
+        See :meth:`MemoryDedupStore.seen`.
+        '''
+        now = time.time()
+        with self._connect() as db:
+            db.execute('DELETE FROM dedup WHERE expires <= ?', (now,))
+            cursor = db.execute('INSERT OR IGNORE INTO dedup (key, expires) VALUES (?, ?)', (key, now + ttl))
+        return cursor.rowcount == 0
+
+
+    def update_states(self, states, ttl):
+        '''
+        See :meth:`MemoryDedupStore.update_states`.
+        '''
+        now = time.time()
+        db = self._connect()
+        with db:
+            # take the write lock first, so concurrent echoes are decided one after another
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('DELETE FROM states WHERE expires <= ?', (now,))
+            current = True
+            for key, state in states.items():
+                row = db.execute('SELECT state FROM states WHERE key = ?', (key,)).fetchone()
+                if row is None or row[0] != state:
+                    current = False
+            if not current:
+                db.executemany('INSERT OR REPLACE INTO states (key, state, expires) VALUES (?, ?, ?)',
+                               [(key, state, now + ttl) for key, state in states.items()])
+        return current
+
+
+def label_states(json_data):
+    '''
+    Computes states of labels a label event leads to.
+
+    State of a label is its name and color, or ``absent`` if the label has been
+    deleted or renamed. Echoes of one change coming from different repositories
+    lead to the same states.
+
+    :param json_data: Parsed payload of the request.
+    :return: Dictionary of keys identifying labels (by case-insensitive name) as keys and their states as values.
+    '''
+    label = json_data['label']
+    old_label = ((json_data.get('changes') or {}).get('name') or {}).get('from', label['name'])
+    states = {}
+    if old_label.casefold() != label['name'].casefold():
+        states['label\0' + old_label.casefold()] = ABSENT
+    if json_data['action'] == 'deleted':
+        states['label\0' + label['name'].casefold()] = ABSENT
+    else:
+        states['label\0' + label['name'].casefold()] = '\0'.join([label['name'], label.get('color', '').lower()])
+    return states
@@ -1,6 +1,16 @@
 import click
+import collections
+import concurrent.futures
+import io
 import requests
+import sys
+import urllib.parse
 from .helpers import *
+from .metrics import emit, registry
+from .audit import DriftReport
+from .groups import GroupTemplates
+from .profile import span
+from .plan import compute_plan
 
 
 @click.pass_context
@@ -8,16 +18,73 @@ def get_response(ctx, uri):
     '''
     Gets a response from GitHub API.
 
-    :param uri: Part of URL after https://api.github.com/ to retrieve response from.
+    :param uri: Part of URL after the API URL to retrieve response from.
     :return: Tuple of response and status code.
     '''
-    session = ctx.obj.get('session', requests.Session())
-    response = session.get('https://api.github.com/' + uri)
+    return fetch(ctx.obj.get('session', requests.Session()), uri)
+
+
+def fetch(session, uri, headers=None):
+    '''
+    Gets a response from GitHub API using given session.
+
+    Unlike :func:`get_response` doesn't need click context, so it can be used from worker threads.
+
+    :param session: Session to use for communication with GitHub API.
+    :param uri: Part of URL after the API URL to retrieve response from, or full URL.
+    :param headers: Additional request headers.
+    :return: Tuple of response and status code.
+    '''
+    with span('fetch', 'api', uri=uri):
+        response = session.get(uri if '://' in uri else api_url(session, uri), headers=headers)
     if response.status_code == 401:
         error(4, 'GitHub: ERROR {} - {}'.format(response.status_code, response.json().get('message', '')))
     return response, response.status_code
 
 
+def iter_pages(session, uri, prefetch=False):
+    '''
+    Iterates over all pages of a GitHub API listing, following *next* links from the Link header.
+
+    Iteration stops after the first unsuccessful response, which is still yielded.
+
+    :param session: Session to use for communication with GitHub API.
+    :param uri: Part of URL after the API URL of the first page.
+    :param prefetch: True if the next page should be downloaded in background while the current one is processed.
+    :return: Generator of tuples of response and status code.
+    '''
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        response, code = fetch(session, uri)
+        while True:
+            next_url = response.links.get('next', {}).get('url') if code == 200 else None
+            pending = executor.submit(fetch, session, next_url) if executor and next_url else None
+            yield response, code
+            if not next_url:
+                return
+            response, code = pending.result() if pending else fetch(session, next_url)
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
+
+
+def fetch_all(session, uri, prefetch=False):
+    '''
+    Gets all items of a paginated GitHub API listing.
+
+    :param session: Session to use for communication with GitHub API.
+    :param uri: Part of URL after the API URL of the first page.
+    :param prefetch: True if the next page should be downloaded in background while the current one is processed.
+    :return: Tuple of list of items, last response and its status code.
+    '''
+    items = []
+    for response, code in iter_pages(session, uri, prefetch):
+        if code != 200:
+            return items, response, code
+        items.extend(response.json())
+    return items, response, code
+
+
 def update_label(session, repo, label, data):
     '''
     Updates a label with given data.
@@ -28,7 +95,8 @@ def update_label(session, repo, label, data):
     :param data: Data in JSON format for the label to be updated to, containing name and color keys.
     :return: Tuple of status code and response message if some error occured, otherwise None.
     '''
-    response = session.patch('https://api.github.com/repos/{}/labels/{}'.format(repo, label), json=data)
+    with span('update_label', 'api', repo=repo, label=label):
+        response = session.patch(api_url(session, 'repos/{}/labels/{}'.format(repo, urllib.parse.quote(label, safe=''))), json=data)
     if response.status_code == 200:
         return response.status_code, None
     return response.status_code, response.json().get('message', '')
@@ -43,7 +111,8 @@ def add_label(session, repo, data):
     :param data: Data in JSON format for the label to be added, containing name and color keys.
     :return: Tuple of status code and response message if some error occured, otherwise None.
     '''
-    response = session.post('https://api.github.com/repos/{}/labels'.format(repo), json=data)
+    with span('add_label', 'api', repo=repo, label=data['name']):
+        response = session.post(api_url(session, 'repos/{}/labels'.format(repo)), json=data)
     if response.status_code == 201:
         return response.status_code, None
     return response.status_code, response.json().get('message', '')
@@ -58,13 +127,14 @@ def delete_label(session, repo, label):
     :param label: Name of the label to be removed.
     :return: Tuple of status code and response message if some error occured, otherwise None.
     '''
-    response = session.delete('https://api.github.com/repos/{}/labels/{}'.format(repo, label))
+    with span('delete_label', 'api', repo=repo, label=label):
+        response = session.delete(api_url(session, 'repos/{}/labels/{}'.format(repo, urllib.parse.quote(label, safe=''))))
     if response.status_code == 204:
         return response.status_code, None
     return response.status_code, response.json().get('message', '')
 
 
-def log_suc(action_tag, dry_tag, repo, label, color):
+def log_suc(action_tag, dry_tag, repo, label, color, file=None):
     '''
     Logs successfull action.
 
@@ -73,11 +143,12 @@ def log_suc(action_tag, dry_tag, repo, label, color):
     :param repo: Repository name.
     :param label: Label name.
     :param color: Label color.
+    :param file: Stream to write the log to, standard output by default.
     '''
-    print('[{}][{}] {}; {}; {}'.format(action_tag, dry_tag, repo, label, color))
+    print('[{}][{}] {}; {}; {}'.format(action_tag, dry_tag, repo, label, color), file=file)
 
 
-def log_err(tag, repo, label, color, code, msg):
+def log_err(tag, repo, label, color, code, msg, file=None):
     '''
     Logs unsuccessful action.
 
@@ -87,101 +158,309 @@ def log_err(tag, repo, label, color, code, msg):
     :param color: Label color.
     :param code: Response code.
     :param msg: Response message.
+    :param file: Stream to write the log to, standard output by default.
     '''
-    print('[{}][ERR] {}; {}; {}; {} - {}'.format(tag, repo, label, color, code, msg))
+    print('[{}][ERR] {}; {}; {}; {} - {}'.format(tag, repo, label, color, code, msg), file=file)
 
 
-def perform_operation(replace, repos, labels, dry_run, logging, session):
+def report(tag, repo, label, color, code, expected, message, logging, out, err):
     '''
-    Performs a given operation with labels on GitHub repositories.
+    Logs result of a single label operation.
+
+    :param tag: Tag for action done.
+    :param repo: Repository name.
+    :param label: Label name.
+    :param color: Label color.
+    :param code: Response code.
+    :param expected: Response code meaning success.
+    :param message: Response message.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param out: Stream for regular logs.
+    :param err: Stream for error logs.
+    :return: 1 if operation failed, 0 otherwise.
+    '''
+    emit('label', action=tag, repo=repo, label=label, color=color, code=code, ok=code == expected, message=message)
+    if code == expected:
+        if logging == 1:
+            log_suc(tag, 'SUC', repo, label, color, file=out)
+        return 0
+    if logging == 1:
+        log_err(tag, repo, label, color, code, message, file=out)
+    elif logging == 0:
+        print('ERROR: {}; {}; {}; {}; {} - {}'.format(tag, repo, label, color, code, message), file=err)
+    return 1
+
+
+def read_labels(session, repo):
+    '''
+    Reads all labels of the repository.
+
+    :param session: Session to use for communication with GitHub API.
+    :param repo: Full repository name.
+    :return: Tuple of dictionary of label names as keys and colors as values, list of tuples of URL and ETag of each page, last response and its status code.
+    '''
+    repo_labels = {}
+    pages = []
+    for response, code in iter_pages(session, 'repos/{}/labels?per_page=100'.format(repo)):
+        if code != 200:
+            return repo_labels, pages, response, code
+        pages.append((response.url, response.headers.get('ETag', '')))
+        repo_labels.update((label['name'], label['color']) for label in response.json())
+    return repo_labels, pages, response, code
+
+
+def is_fresh(session, pages):
+    '''
+    Checks with conditional requests that label listing pages haven't changed.
+
+    Responses with status 304 don't count against GitHub rate limit.
+
+    :param session: Session to use for communication with GitHub API.
+    :param pages: List of tuples of URL and ETag of each page.
+    :return: True if none of the pages has changed, False otherwise.
+    '''
+    if not pages or not all(etag for url, etag in pages):
+        return False
+    for url, etag in pages:
+        response, code = fetch(session, url, {'If-None-Match': etag})
+        if code != 304:
+            return False
+    return True
+
+
+def plan_repo(replace, repo, labels, logging, session, out=None, err=None, mirror=None, incremental=False, reader=None, renames=None):
+    '''
+    Reads labels of the repository and computes operations needed to synchronize it with the template.
+
+    In incremental mode labels are taken from the mirror if it has been updated recently
+    or if GitHub confirms with a conditional request that they haven't changed.
 
     :param replace: True if labels should be completely replaced by the templates.
-    :param repos: Full names of the repositories for the action to be performed on.
-    :param labels: Names of the template labels.
-    :param dry_run: True if operation should not be done on actual GitHub repositories.
-    :param logging: 1 if logs should be printed on stdout, 0 otherwise.
+    :param repo: Full name of the repository.
+    :param labels: Dictionary of template label names as keys and colors as values,
+                   or function taking full repository name and returning such dictionary
+                   (like :class:`~labelord.groups.GroupTemplates`).
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
     :param session: Session to use for communication with GitHub API.
+    :param out: Stream for regular logs, standard output by default.
+    :param err: Stream for error logs, standard error by default.
+    :param mirror: :class:`~labelord.mirror.LabelMirror` to be updated with read labels or None.
+    :param incremental: True if labels should be taken from the mirror when possible.
+    :param reader: Function with interface of :func:`read_labels` used to read labels, :func:`read_labels` by default.
+    :param renames: :class:`~labelord.plan.Renames` used to recognize renamed labels or None.
+    :return: :class:`~labelord.plan.RepoPlan` instance or None if labels couldn't be read.
     '''
-    errors = 0
-    update_repos = set()
-    for repo in repos:
-        response, code = get_response('repos/{}/labels?per_page=100&page=1'.format(repo))
+    if callable(labels):
+        labels = labels(repo)
+    if mirror is not None and incremental:
+        entry = mirror.get(repo)
+        if entry is not None:
+            recent = mirror.is_recent(entry)
+            if recent or is_fresh(session, entry.pages):
+                if not recent:
+                    mirror.touch(repo)
+                with registry.timer('labelord_phase_seconds', phase='diff'), span('compute_plan', 'diff', repo=repo):
+                    plan = compute_plan(repo, labels, entry.labels, replace, renames)
+                plan.pages = entry.pages
+                return plan
+    repo_labels, pages, response, code = (reader or read_labels)(session, repo)
+    if mirror is not None:
         if code == 200:
-            update_repos.add(repo)
-            repo_labels = {label['name']: label['color'] for label in response.json()}
-            labels_to_delete = set()
-            if replace:
-                labels_to_delete = {label for label in repo_labels} - {label for label in labels}
-            for label in labels:
-                if label.lower() in (repo_label.lower() for repo_label in repo_labels):
-                    rlabel = list(filter(lambda rlabel: rlabel == label.lower(), (rlabel.lower() for rlabel in repo_labels)))[0]
-                    if labels.get(label, 'label') != repo_labels.get(label, 'repo_label'):
-                        if not dry_run:
-                            update_data = {"name": label, "color": labels[label]}
-                            response_code, message = update_label(session, repo, rlabel, update_data)
-                            if response_code == 200 and logging == 1:
-                                log_suc('UPD', 'SUC', repo, label, labels[label])
-                                # print('[UPD][SUC] {}; {}; {}'.format(repo, label, labels[label]))
-                            elif response_code != 200 and logging == 1:
-                                log_err('UPD', repo, label, labels[label], response_code, message)
-                                # print('[UPD][ERR] {}; {}; {}; {} - {}'.format(repo, label, labels[label], response_code, message))
-                                errors += 1
-                            elif response_code != 200 and logging == 0:
-                                error(0, 'ERROR: UPD; {}; {}; {}; {} - {}'.format(repo, label, labels[label], response_code, message))
-                                errors += 1
-                            elif response_code != 200:
-                                errors += 1
-                        else:
-                            if logging == 1:
-                                log_suc('UPD', 'DRY', repo, label, labels[label])
-                                # print('[UPD][DRY] {}; {}; {}'.format(repo, label, labels[label]))
-                else:
-                    if not dry_run:
-                        add_data = {"name": label, "color": labels[label]}
-                        response_code, message = add_label(session, repo, add_data)
-                        if response_code == 201 and logging == 1:
-                            log_suc('ADD', 'SUC', repo, label, labels[label])
-                            # print('[ADD][SUC] {}; {}; {}'.format(repo, label, labels[label]))
-                        elif response_code != 201 and logging == 1:
-                            log_err('ADD', repo, label, labels[label], response_code, message)
-                            # print('[ADD][ERR] {}; {}; {}; {} - {}'.format(repo, label, labels[label], response_code, message))
-                            errors += 1
-                        elif response_code != 201 and logging == 0:
-                            error(0, 'ERROR: ADD; {}; {}; {}; {} - {}'.format(repo, label, labels[label], response_code, message))
-                            errors += 1
-                        elif response_code != 201:
-                            errors += 1
-                    else:
-                        if logging == 1:
-                            log_suc('ADD', 'DRY', repo, label, labels[label])
-                            # print('[ADD][DRY] {}; {}; {}'.format(repo, label, labels[label]))
-            for label in labels_to_delete:
-                if not dry_run:
-                    response_code, message = delete_label(session, repo, label)
-                    if response_code == 204 and logging == 1:
-                        log_suc('DEL', 'SUC', repo, label, repo_labels[label])
-                        # print('[DEL][SUC] {}; {}; {}'.format(repo, label, repo_labels[label]))
-                    elif response_code != 204 and logging == 1:
-                        log_err('DEL', repo, label, repo_labels[label], response_code, message)
-                        # print('[DEL][ERR] {}; {}; {}; {} - {}'.format(repo, label, repo_labels[label], response_code, message))
-                        errors += 1
-                    elif response_code != 204 and logging == 0:
-                        error(0, 'ERROR: DEL; {}; {}; {}; {} - {}'.format(repo, label, repo_labels[label], response_code, message))
-                        errors += 1
-                    elif response_code != 204:
-                        errors += 1
-                else:
-                    if logging == 1:
-                        log_suc('DEL', 'SUC', repo, label, repo_labels[label])
-                        # print('[DEL][DRY] {}; {}; {}'.format(repo, label, repo_labels[label]))
-        elif logging == 1:
-            print('[LBL][ERR] {}; {} - {}'.format(repo, code, response.json().get('message', '')))
-            errors += 1
+            mirror.store(repo, repo_labels, pages)
+        else:
+            mirror.forget(repo)
+    if code != 200:
+        emit('repo', repo=repo, code=code, ok=False, message=response.json().get('message', ''))
+        if logging == 1:
+            print('[LBL][ERR] {}; {} - {}'.format(repo, code, response.json().get('message', '')), file=out)
         elif logging == 0:
-            error(0, 'ERROR: LBL; {}; {} - {}'.format(repo, code, response.json().get('message', '')))
-            errors += 1
+            print('ERROR: LBL; {}; {} - {}'.format(repo, code, response.json().get('message', '')), file=err if err is not None else sys.stderr)
+        return None
+    with registry.timer('labelord_phase_seconds', phase='diff'), span('compute_plan', 'diff', repo=repo):
+        plan = compute_plan(repo, labels, repo_labels, replace, renames)
+    plan.pages = pages
+    return plan
+
+
+def update_mirror(mirror, plan, errors, dry_run):
+    '''
+    Updates the mirror after the plan has been performed.
+
+    :param mirror: :class:`~labelord.mirror.LabelMirror` instance or None.
+    :param plan: :class:`~labelord.plan.RepoPlan` which has been performed.
+    :param errors: Number of errors.
+    :param dry_run: True if the plan was performed in dry-run mode.
+    '''
+    if mirror is None or dry_run or not len(plan):
+        return
+    if errors:
+        mirror.forget(plan.repo)
+    else:
+        mirror.apply_plan(plan)
+
+
+def process_repo(replace, repo, labels, dry_run, logging, session, mirror=None, incremental=False, reader=None, renames=None):
+    '''
+    Performs a given operation with labels on a single GitHub repository.
+
+    Logs are not printed but collected, so repositories processed concurrently
+    don't mix their output.
+
+    :param replace: True if labels should be completely replaced by the templates.
+    :param repo: Full name of the repository for the action to be performed on.
+    :param labels: Template labels, see :func:`plan_repo`.
+    :param dry_run: True if operation should not be done on actual GitHub repository.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param session: Session to use for communication with GitHub API.
+    :param mirror: :class:`~labelord.mirror.LabelMirror` to be kept up to date or None.
+    :param incremental: True if labels should be taken from the mirror when possible.
+    :param reader: Function with interface of :func:`read_labels` used to read labels.
+    :param renames: :class:`~labelord.plan.Renames` used to recognize renamed labels or None.
+    :return: Tuple of number of errors, True if repository labels were read, standard output and error output.
+    '''
+    out, err = io.StringIO(), io.StringIO()
+    plan = plan_repo(replace, repo, labels, logging, session, out, err, mirror, incremental, reader, renames)
+    if plan is None:
+        return 1, False, out.getvalue(), err.getvalue()
+    errors = apply_plan(plan, dry_run, logging, session, out, err)
+    update_mirror(mirror, plan, errors, dry_run)
+    return errors, True, out.getvalue(), err.getvalue()
+
+
+def process_plan(plan, replace, labels, dry_run, logging, session, mirror=None, renames=None):
+    '''
+    Performs previously computed plan on its GitHub repository.
+
+    If the repository labels changed since the plan was computed, the plan is computed again.
+
+    :param plan: :class:`~labelord.plan.RepoPlan` to be performed.
+    :param replace: True if labels should be completely replaced by the templates.
+    :param labels: Template labels, see :func:`plan_repo`.
+    :param dry_run: True if operation should not be done on actual GitHub repository.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param session: Session to use for communication with GitHub API.
+    :param mirror: :class:`~labelord.mirror.LabelMirror` to be kept up to date or None.
+    :param renames: :class:`~labelord.plan.Renames` used to recognize renamed labels when the plan is computed again, or None.
+    :return: Tuple of number of errors, True if the plan was stale, standard output and error output.
+    '''
+    out, err = io.StringIO(), io.StringIO()
+    stale = not is_fresh(session, plan.pages)
+    if stale:
+        plan = plan_repo(replace, plan.repo, labels, logging, session, out, err, mirror, renames=renames)
+        if plan is None:
+            return 1, stale, out.getvalue(), err.getvalue()
+    errors = apply_plan(plan, dry_run, logging, session, out, err)
+    update_mirror(mirror, plan, errors, dry_run)
+    return errors, stale, out.getvalue(), err.getvalue()
+
+
+def apply_plan(plan, dry_run, logging, session, out=None, err=None):
+    '''
+    Performs operations of the plan on its GitHub repository.
+
+    :param plan: :class:`~labelord.plan.RepoPlan` to be performed.
+    :param dry_run: True if operation should not be done on actual GitHub repository.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param session: Session to use for communication with GitHub API.
+    :param out: Stream for regular logs, standard output by default.
+    :param err: Stream for error logs, standard error by default.
+    :return: Number of errors.
+    '''
+    err = err if err is not None else sys.stderr
+    repo = plan.repo
+    errors = 0
+    for current, label, color in plan.updates:
+        # renamed labels keep their issues, so they're logged with both names
+        tag, name = ('REN', '{} -> {}'.format(current, label)) if current.casefold() != label.casefold() else ('UPD', label)
+        if not dry_run:
+            response_code, message = update_label(session, repo, current, {"name": label, "color": color})
+            errors += report(tag, repo, name, color, response_code, 200, message, logging, out, err)
+        else:
+            emit('label', action=tag, repo=repo, label=name, color=color, ok=True, dry_run=True)
+            if logging == 1:
+                log_suc(tag, 'DRY', repo, name, color, file=out)
+    for label, color in plan.adds:
+        if not dry_run:
+            response_code, message = add_label(session, repo, {"name": label, "color": color})
+            errors += report('ADD', repo, label, color, response_code, 201, message, logging, out, err)
         else:
-            errors += 1
+            emit('label', action='ADD', repo=repo, label=label, color=color, ok=True, dry_run=True)
+            if logging == 1:
+                log_suc('ADD', 'DRY', repo, label, color, file=out)
+    for label, color in plan.deletes:
+        if not dry_run:
+            response_code, message = delete_label(session, repo, label)
+            errors += report('DEL', repo, label, color, response_code, 204, message, logging, out, err)
+        else:
+            emit('label', action='DEL', repo=repo, label=label, color=color, ok=True, dry_run=True)
+            if logging == 1:
+                log_suc('DEL', 'DRY', repo, label, color, file=out)
+    return errors
+
+
+def run_concurrently(worker, items, jobs, buffer=None):
+    '''
+    Calls the worker for every item on a pool of threads.
+
+    Logs collected by the worker are printed in the order of *items*. Items are
+    taken from the iterable only as the results are consumed, at most *buffer*
+    of them are in progress or waiting to be printed, so *items* can be a
+    generator of any length and memory use doesn't grow with it.
+
+    :param worker: Function taking an item and returning tuple of number of errors, result, standard output and error output.
+    :param items: Iterable of items to be processed.
+    :param jobs: Number of items processed concurrently.
+    :param buffer: Maximal number of items in progress, twice the *jobs* by default.
+    :return: Generator of tuples of number of errors and result.
+    :raises ListingError: If *items* fail to be listed, after items taken so far are processed.
+    '''
+    jobs = max(jobs, 1)
+    buffer = max(buffer or 2 * jobs, jobs)
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            try:
+                for item in items:
+                    pending.append(executor.submit(worker, item))
+                    if len(pending) >= buffer:
+                        yield collect_result(pending.popleft())
+            except ListingError:
+                # items already in progress are finished and logged before the error is passed on
+                while pending:
+                    yield collect_result(pending.popleft())
+                raise
+            while pending:
+                yield collect_result(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def collect_result(future):
+    '''
+    Waits for the worker of :func:`run_concurrently` and prints its logs.
+
+    :param future: Future of the worker.
+    :return: Tuple of number of errors and result.
+    '''
+    errors, result, out, err = future.result()
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    return errors, result
+
+
+def summarize(errors, repos, logging, scheduler=None):
+    '''
+    Prints summary of the operation and exits with code 10 if any error occured.
+
+    :param errors: Number of errors.
+    :param repos: Number of successfully processed repositories.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param scheduler: :class:`~labelord.scheduler.Scheduler` whose counters should be printed in verbose mode.
+    '''
+    emit('summary', errors=errors, repos=repos, phases=registry.summary())
+    if scheduler is not None and logging == 1:
+        print('[SUMMARY] {}'.format(scheduler.summary()))
     if errors > 0:
         if logging == 1:
             print('[SUMMARY] {} error(s) in total, please check log above'.format(errors))
@@ -189,12 +468,154 @@ def perform_operation(replace, repos, labels, dry_run, logging, session):
             print('SUMMARY: {} error(s) in total, please check log above'.format(errors))
         error(10)
     elif logging == 1:
-        print('[SUMMARY] {} repo(s) updated successfully'.format(len(update_repos)))
+        print('[SUMMARY] {} repo(s) updated successfully'.format(repos))
     elif logging == 0:
-        print('SUMMARY: {} repo(s) updated successfully'.format(len(update_repos)))
+        print('SUMMARY: {} repo(s) updated successfully'.format(repos))
+
+
+def perform_operation(replace, repos, labels, dry_run, logging, session, jobs=1, mirror=None, incremental=False, reader=None, renames=None,
+                      journal=None):
+    '''
+    Performs a given operation with labels on GitHub repositories.
+
+    Repositories are processed by a pool of *jobs* threads, logs are still
+    printed grouped per repository and in the order of *repos*. Repositories
+    are read, planned and changed as they come from *repos*, so labels of only
+    a few of them are kept in memory at once.
+
+    :param replace: True if labels should be completely replaced by the templates.
+    :param repos: Iterable of full names of the repositories for the action to be performed on.
+    :param labels: Template labels, see :func:`plan_repo`.
+    :param dry_run: True if operation should not be done on actual GitHub repositories.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param session: Session to use for communication with GitHub API.
+    :param jobs: Number of repositories processed concurrently.
+    :param mirror: :class:`~labelord.mirror.LabelMirror` to be kept up to date or None.
+    :param incremental: True if labels should be taken from the mirror when possible.
+    :param reader: Function with interface of :func:`read_labels` used to read labels.
+    :param renames: :class:`~labelord.plan.Renames` used to recognize renamed labels or None.
+    :param journal: :class:`~labelord.journal.Journal` recording processed repositories or None, it's closed at the end.
+    '''
+    errors = 0
+    update_repos = 0
+
+    def worker(repo):
+        result = process_repo(replace, repo, labels, dry_run, logging, session, mirror, incremental, reader, renames)
+        if journal is not None:
+            journal.record(repo, result[0])
+        return result
+
+    try:
+        for repo_errors, updated in run_concurrently(worker, repos, jobs):
+            errors += repo_errors
+            update_repos += updated
+    except ListingError as e:
+        errors += 1
+        log_listing_error(e, logging)
+    if journal is not None:
+        journal.close(remove=errors == 0)
+        if journal.skipped and logging == 1:
+            print('[RESUME] {} repo(s) finished by the interrupted run skipped'.format(journal.skipped))
+    summarize(errors, update_repos, logging, getattr(session, 'scheduler', None))
+
+
+def create_plans(replace, repos, labels, logging, session, jobs=1, mirror=None, reader=None, renames=None):
+    '''
+    Computes operations needed to synchronize GitHub repositories with the template.
+
+    Planned operations are logged in verbose mode as if they were done in *dry-run* mode.
+
+    :param replace: True if labels should be completely replaced by the templates.
+    :param repos: Iterable of full names of the repositories.
+    :param labels: Template labels, see :func:`plan_repo`.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param session: Session to use for communication with GitHub API.
+    :param jobs: Number of repositories processed concurrently.
+    :param mirror: :class:`~labelord.mirror.LabelMirror` to be updated with read labels or None.
+    :param reader: Function with interface of :func:`read_labels` used to read labels.
+    :param renames: :class:`~labelord.plan.Renames` used to recognize renamed labels or None.
+    :return: Tuple of list of :class:`~labelord.plan.RepoPlan` instances and number of errors.
+    '''
+    def worker(repo):
+        out, err = io.StringIO(), io.StringIO()
+        plan = plan_repo(replace, repo, labels, logging, session, out, err, mirror, reader=reader, renames=renames)
+        if plan is not None:
+            apply_plan(plan, True, logging, session, out, err)
+        return int(plan is None), plan, out.getvalue(), err.getvalue()
+    plans = []
+    errors = 0
+    try:
+        for repo_errors, plan in run_concurrently(worker, repos, jobs):
+            errors += repo_errors
+            if plan is not None:
+                plans.append(plan)
+    except ListingError as e:
+        errors += 1
+        log_listing_error(e, logging)
+    return plans, errors
+
+
+def audit_repos(repos, labels, session, jobs=1, mirror=None, incremental=False, reader=None, renames=None):
+    '''
+    Computes drift of GitHub repositories from the template without changing them.
+
+    Repositories are read concurrently and compared with the template like in
+    replace mode of :func:`perform_operation`, errors are printed to standard error output.
+
+    :param repos: Iterable of full names of the repositories.
+    :param labels: Template labels, see :func:`plan_repo`.
+    :param session: Session to use for communication with GitHub API.
+    :param jobs: Number of repositories read concurrently.
+    :param mirror: :class:`~labelord.mirror.LabelMirror` to be updated with read labels or None.
+    :param incremental: True if labels should be taken from the mirror when possible.
+    :param reader: Function with interface of :func:`read_labels` used to read labels.
+    :param renames: :class:`~labelord.plan.Renames` used to recognize renamed labels or None.
+    :return: :class:`~labelord.audit.DriftReport` instance.
+    '''
+    def worker(repo):
+        out, err = io.StringIO(), io.StringIO()
+        plan = plan_repo(True, repo, labels, 0, session, out, err, mirror, incremental, reader, renames)
+        return int(plan is None), (repo, plan), '', err.getvalue()
+    drift = DriftReport()
+    try:
+        for repo_errors, (repo, plan) in run_concurrently(worker, repos, jobs):
+            if plan is None:
+                drift.add_error(repo)
+            else:
+                drift.add(plan)
+    except ListingError as e:
+        drift.listing_errors += 1
+        log_listing_error(e, 0)
+    return drift
 
 
-def get_labels(template_repository, config):
+def apply_plans(plans, replace, labels, dry_run, logging, session, jobs=1, mirror=None, renames=None):
+    '''
+    Performs previously computed plans on GitHub repositories.
+
+    :param plans: List of :class:`~labelord.plan.RepoPlan` instances.
+    :param replace: True if labels should be completely replaced by the templates.
+    :param labels: Template labels, see :func:`plan_repo`.
+    :param dry_run: True if operation should not be done on actual GitHub repositories.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    :param session: Session to use for communication with GitHub API.
+    :param jobs: Number of repositories processed concurrently.
+    :param mirror: :class:`~labelord.mirror.LabelMirror` to be kept up to date or None.
+    :param renames: :class:`~labelord.plan.Renames` used to recognize renamed labels in stale repositories or None.
+    '''
+    errors = 0
+    stale = 0
+    worker = lambda plan: process_plan(plan, replace, labels, dry_run, logging, session, mirror, renames)
+    for repo_errors, repo_stale in run_concurrently(worker, plans, jobs):
+        errors += repo_errors
+        stale += repo_stale
+    if stale and logging == 1:
+        print('[PLAN] {} repo(s) changed since the plan was created, their plans were computed again'.format(stale))
+    summarize(errors, len(plans), logging, getattr(session, 'scheduler', None))
+
+
+@click.pass_context
+def get_labels(ctx, template_repository, config):
     '''
     Gets labels names and color from repository.
 
@@ -202,10 +623,11 @@ def get_labels(template_repository, config):
     :param config: Config loaded with configparser to be used as a template if template_repository is not provided.
     :return: Dictionary of label names as keys and labels colors as values.
     '''
+    session = ctx.obj.get('session', requests.Session())
     if template_repository:
-        response, code = get_response('repos/{}/labels?per_page=100&page=1'.format(template_repository))
+        items, response, code = fetch_all(session, 'repos/{}/labels?per_page=100'.format(template_repository), True)
         if code == 200:
-            return {label['name']: label['color'] for label in response.json()}
+            return {label['name']: label['color'] for label in items}
         else:
             error(10, response.json().get('message', ''))
     elif 'labels' in config:
@@ -214,21 +636,89 @@ def get_labels(template_repository, config):
         error(6, 'No labels specification has been found')
 
 
-def get_repos(all_repos, config):
+def get_group_templates(config, names=()):
+    '''
+    Gets templates of repository groups defined in the configuration.
+
+    Labels of every template repository are read once, even if more groups use it.
+
+    :param config: Config loaded with configparser.
+    :param names: Names of groups to be synchronized, all groups by default.
+    :return: :class:`~labelord.groups.GroupTemplates` instance or None if there are no groups in the configuration.
+    '''
+    try:
+        return GroupTemplates.from_config(config, lambda repo: get_labels(repo, config), names)
+    except ValueError as e:
+        error(6, str(e))
+
+
+@click.pass_context
+def get_repos(ctx, all_repos, config):
     '''
     Gets full repositories names which should be used to work with Labelord application.
 
+    All accessible repositories are listed lazily, only the first page is read
+    immediately, so errors are reported before any repository is processed.
+
     :param all_repos: True if all users repositories should be used.
     :param config: Config loaded with configparser which contains repositories to be used.
-    :return: Array of full repositories names.
+    :return: List of full repositories names, or their generator if *all_repos* is set.
     '''
+    session = ctx.obj.get('session', requests.Session())
     if all_repos:
-        response, code = get_response('user/repos?per_page=100&page=1')
-        if code == 200:
-            return [repo['full_name'] for repo in response.json()]
-        else:
+        pages = iter_pages(session, 'user/repos?per_page=100', True)
+        response, code = next(pages)
+        if code != 200:
             error(10, response.json().get('message', ''))
+        return stream_repos(response, pages)
     elif 'repos' in config:
         return [repo for repo in config['repos'] if config['repos'].getboolean(repo)]
     else:
         error(7, 'No repositories specification has been found')
+
+
+class ListingError(Exception):
+    '''
+    Raised when a page of the repository listing following the first one can't be read.
+
+    :param code: Response code.
+    :param message: Response message.
+    '''
+
+    def __init__(self, code, message):
+        super().__init__('{} - {}'.format(code, message))
+        self.code = code
+        self.message = message
+
+
+def stream_repos(response, pages):
+    '''
+    Iterates over full names of repositories from pages of a repository listing.
+
+    :param response: Response with the first page.
+    :param pages: Generator of the following pages from :func:`iter_pages`.
+    :return: Generator of full repositories names.
+    :raises ListingError: If any of the following pages can't be read, repositories
+                          listed so far can still be processed before it's handled.
+    '''
+    for repo in response.json():
+        yield repo['full_name']
+    for response, code in pages:
+        if code != 200:
+            raise ListingError(code, response.json().get('message', ''))
+        for repo in response.json():
+            yield repo['full_name']
+
+
+def log_listing_error(e, logging):
+    '''
+    Logs repository listing which failed part way through.
+
+    :param e: :class:`ListingError` instance.
+    :param logging: 1 if verbose, 2 if quiet, 0 otherwise.
+    '''
+    emit('listing', code=e.code, ok=False, message=e.message)
+    if logging == 1:
+        print('[LST][ERR] user/repos; {} - {}'.format(e.code, e.message))
+    elif logging == 0:
+        print('ERROR: LST; user/repos; {} - {}'.format(e.code, e.message), file=sys.stderr)
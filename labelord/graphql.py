@@ -0,0 +1,187 @@
+import collections
+import itertools
+import threading
+from .helpers import api_url, error
+from .profile import span
+
+
+LABELS_FIELD = '''{alias}: repository(owner: $owner{i}, name: $name{i}) {{
+    labels(first: 100, after: $after{i}) {{
+      nodes {{ name color }}
+      pageInfo {{ hasNextPage endCursor }}
+    }}
+  }}'''
+
+
+class ErrorResponse:
+    '''
+    Stands in for a response of REST API for a repository which couldn't be read.
+
+    :param status_code: Status code matching the error, 404 for missing repositories.
+    :param message: Error message.
+    '''
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.message = message
+
+
+    def json(self):
+        return {'message': self.message}
+
+
+def build_query(batch):
+    '''
+    Builds a query reading one page of labels of several repositories.
+
+    Every repository gets its own alias, names and cursors are passed as variables.
+
+    :param batch: List of tuples of full repository name and cursor of the page or None.
+    :return: Tuple of query text and dictionary of its variables.
+    '''
+    params = []
+    fields = []
+    variables = {}
+    for i, (repo, cursor) in enumerate(batch):
+        owner, name = repo.split('/', 1)
+        params.append('$owner{0}: String!, $name{0}: String!, $after{0}: String'.format(i))
+        fields.append(LABELS_FIELD.format(alias='r{}'.format(i), i=i))
+        variables.update({'owner{}'.format(i): owner, 'name{}'.format(i): name, 'after{}'.format(i): cursor})
+    return 'query({}) {{\n  {}\n}}'.format(', '.join(params), '\n  '.join(fields)), variables
+
+
+def query_labels(session, batch):
+    '''
+    Reads one page of labels of several repositories with a single request.
+
+    :param session: Session to use for communication with GitHub API.
+    :param batch: List of tuples of full repository name and cursor of the page or None.
+    :return: Tuple of list of results and the response, result is a tuple of dictionary of label names
+             as keys and colors as values, cursor of the next page or None and :class:`ErrorResponse` or None.
+    '''
+    query, variables = build_query(batch)
+    with span('query_labels', 'api', repos=len(batch)):
+        response = session.post(api_url(session, 'graphql'), json={'query': query, 'variables': variables})
+    if response.status_code == 401:
+        error(4, 'GitHub: ERROR {} - {}'.format(response.status_code, response.json().get('message', '')))
+    if response.status_code != 200:
+        failure = ErrorResponse(response.status_code, response.json().get('message', ''))
+        return [({}, None, failure) for repo in batch], response
+    body = response.json()
+    data = body.get('data') or {}
+    errors = {}
+    for item in body.get('errors', []):
+        path = item.get('path') or ['']
+        errors[path[0]] = ErrorResponse(404 if item.get('type') == 'NOT_FOUND' else 422, item.get('message', ''))
+    results = []
+    for i, repo in enumerate(batch):
+        alias = 'r{}'.format(i)
+        repository = data.get(alias)
+        if repository is None:
+            results.append(({}, None, errors.get(alias, ErrorResponse(404, 'Not Found'))))
+            continue
+        labels = repository['labels']
+        cursor = labels['pageInfo']['endCursor'] if labels['pageInfo']['hasNextPage'] else None
+        results.append(({label['name']: label['color'] for label in labels['nodes']}, cursor, None))
+    return results, response
+
+
+def read_all_labels(session, repos, batch_size=50):
+    '''
+    Reads labels of many repositories with GraphQL API.
+
+    Up to *batch_size* repositories are read by one request, repositories with
+    more than one page of labels are queried again with cursors of their next pages.
+
+    :param session: Session to use for communication with GitHub API.
+    :param repos: Full repositories names.
+    :param batch_size: Maximal number of repositories in one request.
+    :return: Dictionary of full repository names as keys and tuples of dictionary of label names
+             as keys and colors as values, last response and its status code as values.
+    '''
+    labels = {repo: {} for repo in repos}
+    outcomes = {}
+    pending = [(repo, None) for repo in labels]
+    while pending:
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        results, response = query_labels(session, batch)
+        for (repo, cursor), (page, next_cursor, failure) in zip(batch, results):
+            if failure is not None:
+                outcomes[repo] = (labels[repo], failure, failure.status_code)
+                continue
+            labels[repo].update(page)
+            if next_cursor is not None:
+                pending.append((repo, next_cursor))
+            else:
+                outcomes[repo] = (labels[repo], response, 200)
+    return outcomes
+
+
+class GraphQLReader:
+    '''
+    Reads labels of repositories in bulk with GraphQL API.
+
+    Can be used instead of :func:`~labelord.github.read_labels`, labels of all
+    *repos* are read by the first call, so a few requests serve all repositories.
+    Without *repos*, repositories passing through :meth:`stream` are read in
+    batches just before they are processed. Labels are forgotten once they are
+    handed out. GraphQL API doesn't provide *ETag* values, so no pages are returned
+    and labels of repositories read this way are always checked again by ``apply``.
+
+    :param repos: Full repositories names to be read, None if they are passed through :meth:`stream`.
+    :param batch_size: Maximal number of repositories in one request.
+    '''
+
+    def __init__(self, repos=None, batch_size=50):
+        self.repos = list(repos) if repos is not None else None
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._outcomes = None if repos is not None else {}
+
+
+    def stream(self, session, repos, skip=None):
+        '''
+        Reads labels of repositories from the iterable batch by batch as they are consumed.
+
+        Labels which haven't been handed out by the time the batch after next
+        is read are forgotten, so memory doesn't grow with number of repositories.
+
+        :param session: Session to use for communication with GitHub API.
+        :param repos: Iterable of full repositories names.
+        :param skip: Function taking full repository name, returning True if its labels
+                     won't be needed (for example because the mirror serves them).
+        :return: Generator of the same repositories names.
+        '''
+        repos = iter(repos)
+        batches = collections.deque()
+        while True:
+            batch = list(itertools.islice(repos, self.batch_size))
+            if not batch:
+                return
+            read = [repo for repo in batch if skip is None or not skip(repo)]
+            outcomes = read_all_labels(session, read, self.batch_size) if read else {}
+            with self._lock:
+                if len(batches) == 2:
+                    for repo in batches.popleft():
+                        self._outcomes.pop(repo, None)
+                self._outcomes.update(outcomes)
+            batches.append(read)
+            yield from batch
+
+
+    def __call__(self, session, repo):
+        '''
+        Gets labels of the repository.
+
+        :param session: Session to use for communication with GitHub API.
+        :param repo: Full repository name.
+        :return: Tuple of dictionary of label names as keys and colors as values, empty list of pages, response and its status code.
+        '''
+        with self._lock:
+            if self._outcomes is None:
+                self._outcomes = read_all_labels(session, self.repos, self.batch_size)
+            outcome = self._outcomes.pop(repo, None)
+        if outcome is None:
+            outcome = read_all_labels(session, [repo], 1)[repo]
+        labels, response, code = outcome
+        return dict(labels), [], response, code
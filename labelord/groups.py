@@ -0,0 +1,195 @@
+import collections
+import re
+
+
+Group = collections.namedtuple('Group', ['name', 'repos', 'template_repo', 'extends', 'labels'])
+Group.__doc__ = '''
+Group of repositories sharing a template, defined by *[group:name]* section of the configuration.
+
+:ivar name: Name of the group.
+:ivar repos: Tuple of full names of repositories in the group.
+:ivar template_repo: Full name of repository whose labels are used as a template or empty string.
+:ivar extends: Tuple of names of groups whose templates are inherited.
+:ivar labels: Dictionary of label names as keys and colors (or ``-`` to drop inherited label) as values from *[labels:name]* section.
+'''
+
+
+REMOVED = '-'
+
+
+def split_list(value):
+    '''
+    Splits whitespace or comma separated list from the configuration.
+
+    :param value: String value.
+    :return: List of items.
+    '''
+    return [item for item in re.split(r'[\s,]+', value) if item]
+
+
+def load_groups(config):
+    '''
+    Reads groups of repositories from the configuration.
+
+    :param config: Config loaded with configparser.
+    :return: Ordered dictionary of group names as keys and :class:`Group` instances as values.
+    '''
+    groups = collections.OrderedDict()
+    for section in config.sections():
+        if not section.startswith('group:'):
+            continue
+        name = section[len('group:'):]
+        options = config[section]
+        labels_section = 'labels:' + name
+        labels = dict(config[labels_section]) if labels_section in config else {}
+        groups[name] = Group(name, tuple(split_list(options.get('repos', ''))), options.get('template-repo', ''),
+                             tuple(split_list(options.get('extends', ''))), labels)
+    return groups
+
+
+def overlay(labels, overrides):
+    '''
+    Applies labels over other ones, matching their names case-insensitively.
+
+    :param labels: Dictionary of label names as keys and colors as values.
+    :param overrides: Dictionary of label names as keys and colors (or ``-`` to drop the label) as values.
+    :return: New dictionary of label names as keys and colors as values.
+    '''
+    merged = collections.OrderedDict((label.casefold(), (label, color)) for label, color in labels.items())
+    for label, color in overrides.items():
+        if color.strip() == REMOVED:
+            merged.pop(label.casefold(), None)
+        else:
+            merged[label.casefold()] = (label, color)
+    return {label: color for label, color in merged.values()}
+
+
+def resolve_templates(groups, read_template, names=None):
+    '''
+    Computes template labels of groups.
+
+    Template of a group consists of templates of groups it extends (in the given order),
+    labels of its template repository and its own labels, each overlaying the previous ones.
+
+    :param groups: Ordered dictionary of group names as keys and :class:`Group` instances as values.
+    :param read_template: Function taking full name of template repository and returning its labels.
+    :param names: Names of groups to be resolved, all groups by default. Template repositories
+                  of other groups are read only if one of these groups extends them.
+    :return: Dictionary of group names as keys and dictionaries of template labels as values,
+             including groups extended by the resolved ones.
+    :raises ValueError: If a group extends unknown group or groups extend each other in a cycle.
+    '''
+    templates = {}
+    repo_labels = {}
+
+    def resolve(name, path):
+        if name in templates:
+            return templates[name]
+        if name in path:
+            raise ValueError('Groups extend each other in a cycle: {}'.format(' -> '.join(path + [name])))
+        if name not in groups:
+            raise ValueError('Group {} extends unknown group {}'.format(path[-1], name))
+        group = groups[name]
+        labels = {}
+        for parent in group.extends:
+            labels = overlay(labels, resolve(parent, path + [name]))
+        if group.template_repo:
+            if group.template_repo not in repo_labels:
+                repo_labels[group.template_repo] = read_template(group.template_repo)
+            labels = overlay(labels, repo_labels[group.template_repo])
+        templates[name] = overlay(labels, group.labels)
+        return templates[name]
+
+    for name in groups if names is None else names:
+        resolve(name, [])
+    return templates
+
+
+class GroupTemplates:
+    '''
+    Template labels of repositories belonging to one or more groups.
+
+    Repository in several groups is synchronized with templates of all of them merged
+    in order of the groups, the later group wins when both define the same label.
+    Can be used in place of template labels dictionary, it's called with full name
+    of repository to get its labels.
+
+    :param templates: Ordered dictionary of group names as keys and dictionaries of template labels as values.
+    :param members: Ordered dictionary of full repository names as keys and lists of their group names as values.
+    '''
+
+    def __init__(self, templates, members):
+        self.templates = templates
+        self.members = members
+        self._merged = {}
+
+
+    @classmethod
+    def from_config(cls, config, read_template, names=None):
+        '''
+        Creates templates of groups from the configuration.
+
+        :param config: Config loaded with configparser.
+        :param read_template: Function taking full name of template repository and returning its labels.
+        :param names: Names of groups whose repositories should be synchronized, all groups by default.
+        :return: :class:`GroupTemplates` instance or None if there are no groups in the configuration.
+        :raises ValueError: If a group is unknown or groups can't be resolved.
+        '''
+        groups = load_groups(config)
+        if not groups:
+            return None
+        for name in names or ():
+            if name not in groups:
+                raise ValueError('Group {} has not been found'.format(name))
+        selected = [name for name in groups if not names or name in names]
+        templates = resolve_templates(groups, read_template, selected)
+        members = collections.OrderedDict()
+        for name in selected:
+            for repo in groups[name].repos:
+                members.setdefault(repo, []).append(name)
+        return cls(collections.OrderedDict((name, templates[name]) for name in selected), members)
+
+
+    def repos(self):
+        '''
+        Gets repositories of all groups.
+
+        :return: List of full repository names, each of them once.
+        '''
+        return list(self.members)
+
+
+    def __call__(self, repo):
+        '''
+        Gets template labels of the repository.
+
+        :param repo: Full repository name.
+        :return: Dictionary of label names as keys and colors as values.
+        '''
+        names = tuple(self.members.get(repo, ()))
+        if names not in self._merged:
+            labels = {}
+            for name in names:
+                labels = overlay(labels, self.templates[name])
+            self._merged[names] = labels
+        return self._merged[names]
+
+
+    def to_dict(self):
+        '''
+        Converts the templates to JSON serializable dictionary.
+
+        :return: Dictionary with templates and members keys.
+        '''
+        return {'templates': self.templates, 'members': self.members}
+
+
+    @classmethod
+    def from_dict(cls, data):
+        '''
+        Creates the templates from dictionary created by :meth:`to_dict`.
+
+        :param data: Dictionary with templates and members keys.
+        :return: :class:`GroupTemplates` instance.
+        '''
+        return cls(collections.OrderedDict(data['templates']), collections.OrderedDict(data['members']))
@@ -1,36 +1,64 @@
 import hashlib
 import hmac
-import requests
-import json
-import flask
 import sys
+from .dedup import label_states
+
+
+DELIVERY_TTL = 24 * 60 * 60
+API_URL = 'https://api.github.com/'
+
+
+def api_url(session, path):
+    '''
+    Builds URL of GitHub API endpoint.
+
+    Sessions created by :func:`~labelord.session.create_session` may point
+    to another API server with their *api_url* attribute.
+
+    :param session: Session to use for communication with GitHub API.
+    :param path: Part of URL after the API URL.
+    :return: Full URL.
+    '''
+    return getattr(session, 'api_url', API_URL) + path
 
 
 def check_config(lblconfig):
     '''
-    Checks if config file is valid.
+    Checks if config file is valid, exits if it's not.
 
     :param lblconfig: Config loaded with configparser to be checked.
     '''
+    problem = config_problem(lblconfig)
+    if problem:
+        error(*problem)
+
+
+def config_problem(lblconfig):
+    '''
+    Finds out what is wrong with the config file.
+
+    :param lblconfig: Config loaded with configparser to be checked.
+    :return: Tuple of return value and error message or None if config is valid.
+    '''
     token = lblconfig.get('github', 'token', fallback='')
     webhook_secret = lblconfig.get('github', 'webhook_secret', fallback='')
     if not webhook_secret:
-        error(8, 'No webhook secret has been provided')
+        return 8, 'No webhook secret has been provided'
     elif not 'repos' in lblconfig:
-        error(7, 'No repositories specification has been found')
+        return 7, 'No repositories specification has been found'
     elif not token:
-        error(3, 'No GitHub token has been provided')
+        return 3, 'No GitHub token has been provided'
+    return None
 
 
-def verify_signature(request, app):
+def verify_signature(request, secret):
     '''
     Verifies signature of request.
 
     :param request: Request which signature should be verified.
-    :param app: Flask app variable.
+    :param secret: Webhook secret.
     :return: True if signature is ok, False otherwise.
     '''
-    secret = app.lblconfig.get('github', 'webhook_secret', fallback='')
     request_signature = request.headers.get('X-Hub-Signature', '')
     if not request_signature:
         return False
@@ -38,25 +66,30 @@ def verify_signature(request, app):
     return hmac.compare_digest('sha1=' + signature, request_signature)
 
 
-def is_redundant(app):
+def is_redundant(store, json_data, delivery='', ttl=120):
     '''
     Checks if incoming request is redundant.
 
-    :param app: Flask app variable.
+    Request is redundant if the delivery has already been received (GitHub
+    redelivers webhooks), or if it leads to the state the label is already in
+    according to the latest change received within *ttl* seconds, which happens
+    when other repositories report changes done by Labelord itself. Repeated
+    changes of a label, like changing its color back, are never redundant.
+
+    :param store: :class:`~labelord.dedup.MemoryDedupStore` or :class:`~labelord.dedup.SQLiteDedupStore` instance.
+    :param json_data: Parsed payload of the request.
+    :param delivery: Value of X-GitHub-Delivery header.
+    :param ttl: Number of seconds the latest state of a label is remembered for.
     :return: True if request is redundant and should be ignored, False otherwise.
     '''
-    json_data = json.loads(flask.request.data)
-    new_action = json_data['action']
-    new_label = json_data['label']['name']
-    if (new_label != app.lastlabel) or (new_action != app.lastaction):
-        app.lastlabel = new_label
-        app.lastaction = new_action
-        return False
-    return True
+    if delivery and store.seen('delivery\0' + delivery, DELIVERY_TTL):
+        return True
+    return store.update_states(label_states(json_data), ttl)
 
 
 def error(return_value, *args, **kwargs):
     if args:
-        print(*args, file=sys.stderr, **kwargs)
+        kwargs.setdefault('file', sys.stderr)
+        print(*args, **kwargs)
     if return_value > 0:
         sys.exit(return_value)
@@ -0,0 +1,303 @@
+import collections
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+class MemoryJobStore:
+    '''
+    Keeps webhook jobs in memory of the process.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._finished = collections.OrderedDict()
+
+
+    def add(self, payload):
+        '''
+        Stores a new queued job.
+
+        :param payload: JSON serializable description of the job.
+        :return: Job identifier.
+        '''
+        with self._lock:
+            job_id = next(self._ids)
+            self._jobs[job_id] = {'id': job_id, 'payload': payload, 'status': 'queued', 'outcome': None, 'created': time.time(),
+                                  'updated': time.time(), 'owner': None}
+        return job_id
+
+
+    def update(self, job_id, status, outcome=None):
+        '''
+        Changes status of the job.
+
+        :param job_id: Job identifier.
+        :param status: New status, one of *queued*, *running*, *done* or *failed*.
+        :param outcome: JSON serializable result of the job.
+        '''
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = status
+            job['outcome'] = outcome
+            job['updated'] = time.time()
+            self._finished.pop(job_id, None)
+            if status in ('done', 'failed'):
+                self._finished[job_id] = job['updated']
+
+
+    def get(self, job_id):
+        '''
+        Gets the job.
+
+        :param job_id: Job identifier.
+        :return: Dictionary with id, payload, status, outcome, created, updated and owner keys or None.
+        '''
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+    def pending(self):
+        '''
+        Gets jobs which haven't finished.
+
+        :return: List of identifiers of queued and running jobs.
+        '''
+        with self._lock:
+            return [job_id for job_id, job in self._jobs.items() if job['status'] in ('queued', 'running')]
+
+
+    def claim(self, job_id):
+        '''
+        Marks the queued job as running by this process, unless it has been claimed already.
+
+        :param job_id: Job identifier.
+        :return: True if the job has been claimed by this call, False otherwise.
+        '''
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != 'queued':
+                return False
+            job['status'] = 'running'
+            job['updated'] = time.time()
+            job['owner'] = os.getpid()
+            return True
+
+
+    def requeue_running(self, owner=None):
+        '''
+        Marks running jobs as queued again, used after jobs were interrupted by a restart
+        or by death of the process running them.
+
+        :param owner: Process ID, only jobs claimed by this process are requeued if it's given.
+        :return: Number of requeued jobs.
+        '''
+        with self._lock:
+            running = [job for job in self._jobs.values() if job['status'] == 'running' and owner in (None, job['owner'])]
+            for job in running:
+                job['status'] = 'queued'
+                job['owner'] = None
+            return len(running)
+
+
+    def prune(self, max_age=0, max_count=0):
+        '''
+        Removes finished (*done* or *failed*) jobs, so the store doesn't grow without bound.
+
+        :param max_age: Number of seconds finished jobs are kept for, 0 for no limit.
+        :param max_count: Maximal number of kept finished jobs, the oldest ones are removed first, 0 for no limit.
+        :return: Number of removed jobs.
+        '''
+        expired = time.time() - max_age
+        removed = 0
+        with self._lock:
+            while self._finished:
+                job_id, updated = next(iter(self._finished.items()))
+                if not (max_age and updated < expired or max_count and len(self._finished) > max_count):
+                    break
+                del self._finished[job_id]
+                del self._jobs[job_id]
+                removed += 1
+        return removed
+
+
+class SQLiteJobStore:
+    '''
+    Keeps webhook jobs in a SQLite database, so they survive restarts of the server.
+
+    :param path: Path of the database file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT, status TEXT, '
+                       'outcome TEXT, created REAL, updated REAL, owner INTEGER)')
+            # databases created by older versions don't know which process runs the job
+            if 'owner' not in [column[1] for column in db.execute('PRAGMA table_info(jobs)')]:
+                db.execute('ALTER TABLE jobs ADD COLUMN owner INTEGER')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_status_updated ON jobs (status, updated)')
+
+
+    def _connect(self):
+        if not hasattr(self._local, 'db'):
+            self._local.db = sqlite3.connect(self.path, timeout=30)
+        return self._local.db
+
+
+    def add(self, payload):
+        '''
+        See :meth:`MemoryJobStore.add`.
+        '''
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute('INSERT INTO jobs (payload, status, created, updated) VALUES (?, ?, ?, ?)',
+                                (json.dumps(payload), 'queued', now, now))
+        return cursor.lastrowid
+
+
+    def update(self, job_id, status, outcome=None):
+        '''
+        See :meth:`MemoryJobStore.update`.
+        '''
+        with self._connect() as db:
+            db.execute('UPDATE jobs SET status = ?, outcome = ?, updated = ? WHERE id = ?',
+                       (status, json.dumps(outcome), time.time(), job_id))
+
+
+    def get(self, job_id):
+        '''
+        See :meth:`MemoryJobStore.get`.
+        '''
+        row = self._connect().execute('SELECT id, payload, status, outcome, created, updated, owner FROM jobs WHERE id = ?',
+                                      (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'payload': json.loads(row[1]), 'status': row[2], 'outcome': json.loads(row[3]) if row[3] else None,
+                'created': row[4], 'updated': row[5], 'owner': row[6]}
+
+
+    def pending(self):
+        '''
+        See :meth:`MemoryJobStore.pending`.
+        '''
+        rows = self._connect().execute("SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY id").fetchall()
+        return [row[0] for row in rows]
+
+
+    def claim(self, job_id):
+        '''
+        See :meth:`MemoryJobStore.claim`, only one of processes sharing the database claims the job.
+        '''
+        with self._connect() as db:
+            cursor = db.execute("UPDATE jobs SET status = 'running', updated = ?, owner = ? WHERE id = ? AND status = 'queued'",
+                                (time.time(), os.getpid(), job_id))
+        return cursor.rowcount == 1
+
+
+    def requeue_running(self, owner=None):
+        '''
+        See :meth:`MemoryJobStore.requeue_running`.
+        '''
+        with self._connect() as db:
+            if owner is None:
+                cursor = db.execute("UPDATE jobs SET status = 'queued', updated = ?, owner = NULL WHERE status = 'running'", (time.time(),))
+            else:
+                cursor = db.execute("UPDATE jobs SET status = 'queued', updated = ?, owner = NULL WHERE status = 'running' AND owner = ?",
+                                    (time.time(), owner))
+        return cursor.rowcount
+
+
+    def prune(self, max_age=0, max_count=0):
+        '''
+        See :meth:`MemoryJobStore.prune`.
+        '''
+        removed = 0
+        with self._connect() as db:
+            if max_age:
+                removed += db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                                      (time.time() - max_age,)).rowcount
+            if max_count:
+                removed += db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND id NOT IN "
+                                      "(SELECT id FROM jobs WHERE status IN ('done', 'failed') ORDER BY updated DESC, id DESC LIMIT ?)",
+                                      (max_count,)).rowcount
+        return removed
+
+
+class JobQueue:
+    '''
+    Processes webhook jobs by a pool of background threads.
+
+    Unfinished jobs found in the store when the queue is created are processed again.
+    Every job is claimed in the store before it's processed, so several queues
+    (for example in different processes) can share one :class:`SQLiteJobStore`.
+
+    :param handler: Function taking job payload and returning its JSON serializable outcome.
+    :param store: :class:`MemoryJobStore` or :class:`SQLiteJobStore` instance.
+    :param workers: Number of worker threads.
+    :param recover: Requeue jobs left running by a previous run, must be False when other queues share the store.
+    :param retention: Number of seconds finished jobs are kept for, 0 for no limit.
+    :param history: Maximal number of kept finished jobs, 0 for no limit.
+    '''
+
+    def __init__(self, handler, store=None, workers=2, recover=True, retention=86400, history=1000):
+        self.handler = handler
+        self.store = store if store is not None else MemoryJobStore()
+        self.retention = retention
+        self.history = history
+        self._queue = queue.Queue()
+        self._threads = []
+        if recover:
+            self.store.requeue_running()
+        for job_id in self.store.pending():
+            self._queue.put(job_id)
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name='labelord-worker-{}'.format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+
+    def submit(self, payload):
+        '''
+        Adds a new job to the queue.
+
+        :param payload: JSON serializable description of the job passed to the handler.
+        :return: Job identifier.
+        '''
+        job_id = self.store.add(payload)
+        self._queue.put(job_id)
+        self.store.prune(self.retention, self.history)
+        return job_id
+
+
+    def join(self):
+        '''
+        Waits until all submitted jobs are processed.
+        '''
+        self._queue.join()
+
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                if not self.store.claim(job_id):
+                    continue
+                job = self.store.get(job_id)
+                try:
+                    outcome = self.handler(job['payload'])
+                except (Exception, SystemExit) as e:
+                    self.store.update(job_id, 'failed', {'error': str(e)})
+                else:
+                    self.store.update(job_id, 'done', outcome)
+                self.store.prune(self.retention, self.history)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+
+
+JOURNAL_VERSION = 1
+
+
+def fingerprint(*parts):
+    '''
+    Computes fingerprint of settings a run depends on.
+
+    :param parts: JSON serializable values, for example mode and template labels.
+    :return: Hexadecimal digest.
+    '''
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class Journal:
+    '''
+    Progress journal of a run, which allows an interrupted run to be resumed.
+
+    Every repository is written to the file as a JSON line as soon as it's
+    processed, so the journal survives the process being killed. Only repositories
+    processed without errors are skipped by the resumed run, the others are read
+    and planned again, which also skips their operations that have been done.
+    Can be shared by multiple threads.
+
+    :param path: Path of the journal file.
+    :param fingerprint: Fingerprint of settings of the run, see :func:`fingerprint`.
+    :param resume: True if repositories finished by the previous run with the same fingerprint should be skipped.
+    :ivar finished: Set of repositories finished by the previous run.
+    :ivar mismatch: True if the previous run had different settings, so nothing is skipped.
+    :ivar skipped: Number of repositories skipped by :meth:`pending`.
+    '''
+
+    def __init__(self, path, fingerprint, resume=False):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.finished = set()
+        self.mismatch = False
+        self.skipped = 0
+        self._lock = threading.Lock()
+        if resume:
+            previous, self.finished = self.load(path)
+            self.mismatch = previous is not None and previous != fingerprint
+            if self.mismatch:
+                self.finished = set()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.finished:
+            self._file = open(path, 'a')
+        else:
+            self._file = open(path, 'w')
+            self._write({'version': JOURNAL_VERSION, 'fingerprint': fingerprint})
+
+
+    @staticmethod
+    def load(path):
+        '''
+        Reads the journal file, a line cut off by interruption is ignored.
+
+        :param path: Path of the journal file.
+        :return: Tuple of fingerprint (None if there is no valid journal) and set of finished repositories.
+        '''
+        finished = set()
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None, finished
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return None, finished
+        if header.get('version') != JOURNAL_VERSION:
+            return None, finished
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('errors'):
+                finished.discard(entry['repo'])
+            else:
+                finished.add(entry['repo'])
+        return header.get('fingerprint'), finished
+
+
+    def __contains__(self, repo):
+        return repo in self.finished
+
+
+    def pending(self, repos):
+        '''
+        Skips repositories finished by the previous run.
+
+        :param repos: Iterable of full repository names.
+        :return: Generator of full names of repositories which haven't been finished.
+        '''
+        for repo in repos:
+            if repo in self.finished:
+                self.skipped += 1
+            else:
+                yield repo
+
+
+    def record(self, repo, errors):
+        '''
+        Writes outcome of the repository to the journal.
+
+        :param repo: Full repository name.
+        :param errors: Number of errors.
+        '''
+        with self._lock:
+            self._write({'repo': repo, 'errors': errors})
+
+
+    def close(self, remove=False):
+        '''
+        Closes the journal file.
+
+        :param remove: True if the file should be deleted, because there's nothing left to resume.
+        '''
+        with self._lock:
+            self._file.close()
+            if remove:
+                os.remove(self.path)
+
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
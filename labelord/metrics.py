@@ -0,0 +1,229 @@
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    '''
+    Distribution of observed values in cumulative buckets.
+
+    :param buckets: Sorted upper bounds of the buckets.
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        '''
+        Adds a value to the distribution.
+
+        :param value: Observed value.
+        '''
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def cumulative(self):
+        '''
+        Counts values in every bucket including all lower ones.
+
+        :return: List of tuples of upper bound (*+Inf* for the last one) and number of values.
+        '''
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+
+class Metrics:
+    '''
+    Thread-safe registry of counters and histograms with labels.
+
+    Metrics are identified by name and keyword labels, for example
+    ``metrics.inc('labelord_requests_total', method='GET', code='200')``.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+
+    def inc(self, name, amount=1, **labels):
+        '''
+        Increases the counter.
+
+        :param name: Name of the counter.
+        :param amount: Value to be added.
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+
+    def observe(self, name, value, **labels):
+        '''
+        Adds a value to the histogram.
+
+        :param name: Name of the histogram.
+        :param value: Observed value, usually number of seconds.
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        '''
+        Context manager observing number of seconds spent in its block in the histogram.
+
+        :param name: Name of the histogram.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+    def summary(self):
+        '''
+        Describes histograms by their count, sum and average.
+
+        :return: List of dictionaries with name, labels, count, sum and avg keys.
+        '''
+        with self._lock:
+            return [{'name': name, 'labels': dict(labels), 'count': h.count, 'sum': round(h.sum, 6),
+                     'avg': round(h.sum / h.count, 6) if h.count else 0.0}
+                    for (name, labels), h in sorted(self.histograms.items())]
+
+
+    def render(self):
+        '''
+        Renders all metrics in Prometheus text exposition format.
+
+        :return: String with all metrics.
+        '''
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append('# TYPE {} counter'.format(name))
+                    seen.add(name)
+                lines.append('{} {}'.format(format_name(name, labels), value))
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in seen:
+                    lines.append('# TYPE {} histogram'.format(name))
+                    seen.add(name)
+                for bound, count in histogram.cumulative():
+                    lines.append('{} {}'.format(format_name(name + '_bucket', labels + (('le', bound),)), count))
+                lines.append('{} {}'.format(format_name(name + '_sum', labels), histogram.sum))
+                lines.append('{} {}'.format(format_name(name + '_count', labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def format_name(name, labels):
+    '''
+    Formats metric name with labels like Prometheus does.
+
+    :param name: Name of the metric.
+    :param labels: Tuple of tuples of label name and value.
+    :return: Formatted name, for example *labelord_requests_total{code="200",method="GET"}*.
+    '''
+    if not labels:
+        return name
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{}{{{}}}'.format(name, ','.join('{}="{}"'.format(key, escape(value)) for key, value in labels))
+
+
+class EventSink:
+    '''
+    Writes structured events as JSON lines.
+
+    Lines are buffered and written in chunks of about *buffer_size* characters,
+    so logging doesn't slow down processing. Can be shared by multiple threads.
+
+    :param stream: Text stream events are written to.
+    :param buffer_size: Number of characters buffered before they are written.
+    '''
+
+    def __init__(self, stream, buffer_size=65536):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._size = 0
+
+
+    def emit(self, event, **fields):
+        '''
+        Writes an event.
+
+        :param event: Type of the event.
+        :param fields: JSON serializable fields of the event.
+        '''
+        fields['event'] = event
+        fields['time'] = round(time.time(), 6)
+        line = json.dumps(fields, sort_keys=True) + '\n'
+        with self._lock:
+            self._buffer.append(line)
+            self._size += len(line)
+            if self._size >= self.buffer_size:
+                self._write()
+
+
+    def flush(self):
+        '''
+        Writes all buffered events.
+        '''
+        with self._lock:
+            self._write()
+            self.stream.flush()
+
+
+    def _write(self):
+        self.stream.write(''.join(self._buffer))
+        self._buffer = []
+        self._size = 0
+
+
+registry = Metrics()
+sink = None
+
+
+def set_sink(new_sink):
+    '''
+    Sets the sink of events emitted by :func:`emit`.
+
+    :param new_sink: :class:`EventSink` instance or None to stop emitting events.
+    '''
+    global sink
+    sink = new_sink
+
+
+def emit(event, **fields):
+    '''
+    Emits a structured event to the current sink, does nothing if there's none.
+
+    :param event: Type of the event.
+    :param fields: JSON serializable fields of the event.
+    '''
+    if sink is not None:
+        sink.emit(event, **fields)
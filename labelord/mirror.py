@@ -0,0 +1,174 @@
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+MirrorEntry = collections.namedtuple('MirrorEntry', ['labels', 'pages', 'fetched'])
+MirrorEntry.__doc__ = '''
+Labels of one repository kept in the mirror.
+
+:ivar labels: Dictionary of label names as keys and colors as values.
+:ivar pages: List of tuples of URL and ETag of label listing pages, empty if labels were changed since they were read.
+:ivar fetched: Time labels were read or verified in seconds since the epoch.
+'''
+
+
+class LabelMirror:
+    '''
+    Local SQLite copy of labels of GitHub repositories.
+
+    The mirror is filled when labels are read from GitHub and kept up to date
+    with changes done by Labelord and received by the web application.
+
+    :param path: Path of the database file.
+    :param max_age: Number of seconds the mirror is trusted without asking GitHub.
+    '''
+
+    def __init__(self, path, max_age=3600):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS repos (repo TEXT PRIMARY KEY, pages TEXT, fetched REAL)')
+            db.execute('CREATE TABLE IF NOT EXISTS labels (repo TEXT, key TEXT, name TEXT, color TEXT, PRIMARY KEY (repo, key))')
+
+
+    @classmethod
+    def from_config(cls, config, default_directory):
+        '''
+        Creates mirror with settings from *[mirror]* section of the configuration.
+
+        :param config: Config loaded with configparser.
+        :param default_directory: Directory of the database if *path* is not set.
+        :return: :class:`LabelMirror` instance or None if the mirror is turned off.
+        '''
+        if not config.getboolean('mirror', 'enabled', fallback=True):
+            return None
+        path = os.path.expanduser(config.get('mirror', 'path', fallback='')) or os.path.join(default_directory, 'mirror.sqlite')
+        return cls(path, config.getint('mirror', 'max_age', fallback=3600))
+
+
+    def _connect(self):
+        if not hasattr(self._local, 'db'):
+            self._local.db = sqlite3.connect(self.path, timeout=30)
+        return self._local.db
+
+
+    def get(self, repo):
+        '''
+        Gets mirrored labels of the repository.
+
+        :param repo: Full repository name.
+        :return: :class:`MirrorEntry` instance or None if the repository isn't mirrored.
+        '''
+        db = self._connect()
+        row = db.execute('SELECT pages, fetched FROM repos WHERE repo = ?', (repo,)).fetchone()
+        if row is None:
+            return None
+        labels = dict(db.execute('SELECT name, color FROM labels WHERE repo = ?', (repo,)).fetchall())
+        return MirrorEntry(labels, [tuple(page) for page in json.loads(row[0])], row[1])
+
+
+    def is_recent(self, entry):
+        '''
+        Checks if the entry can be trusted without asking GitHub.
+
+        :param entry: :class:`MirrorEntry` instance.
+        :return: True if the entry is younger than *max_age*, False otherwise.
+        '''
+        return time.time() - entry.fetched < self.max_age
+
+
+    def has_recent(self, repo):
+        '''
+        Checks if labels of the repository can be taken from the mirror without asking GitHub.
+
+        :param repo: Full repository name.
+        :return: True if the repository is mirrored and its entry is younger than *max_age*, False otherwise.
+        '''
+        row = self._connect().execute('SELECT fetched FROM repos WHERE repo = ?', (repo,)).fetchone()
+        return row is not None and time.time() - row[0] < self.max_age
+
+
+    def store(self, repo, labels, pages):
+        '''
+        Replaces mirrored labels of the repository with labels read from GitHub.
+
+        :param repo: Full repository name.
+        :param labels: Dictionary of label names as keys and colors as values.
+        :param pages: List of tuples of URL and ETag of label listing pages.
+        '''
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO repos (repo, pages, fetched) VALUES (?, ?, ?)', (repo, json.dumps(pages), time.time()))
+            db.execute('DELETE FROM labels WHERE repo = ?', (repo,))
+            db.executemany('INSERT OR REPLACE INTO labels (repo, key, name, color) VALUES (?, ?, ?, ?)',
+                           [(repo, name.casefold(), name, color) for name, color in labels.items()])
+
+
+    def touch(self, repo):
+        '''
+        Marks mirrored labels of the repository as verified now.
+
+        :param repo: Full repository name.
+        '''
+        with self._connect() as db:
+            db.execute('UPDATE repos SET fetched = ? WHERE repo = ?', (time.time(), repo))
+
+
+    def forget(self, repo):
+        '''
+        Removes the repository from the mirror, so its labels are read from GitHub next time.
+
+        :param repo: Full repository name.
+        '''
+        with self._connect() as db:
+            db.execute('DELETE FROM repos WHERE repo = ?', (repo,))
+            db.execute('DELETE FROM labels WHERE repo = ?', (repo,))
+
+
+    def apply_change(self, repo, event, label, color, old_label):
+        '''
+        Applies a change of one label to the mirrored repository.
+
+        :param repo: Full repository name.
+        :param event: String describing event, can be *created*, *edited* or *deleted*.
+        :param label: Label name.
+        :param color: Label color.
+        :param old_label: Name of the label before the change.
+        '''
+        with self._connect() as db:
+            self._apply(db, repo, event, label, color, old_label)
+
+
+    def apply_plan(self, plan):
+        '''
+        Applies all changes of the plan to the mirrored repository.
+
+        :param plan: :class:`~labelord.plan.RepoPlan` which has been performed.
+        '''
+        with self._connect() as db:
+            for current, label, color in plan.updates:
+                self._apply(db, plan.repo, 'edited', label, color, current)
+            for label, color in plan.adds:
+                self._apply(db, plan.repo, 'created', label, color, label)
+            for label, color in plan.deletes:
+                self._apply(db, plan.repo, 'deleted', label, color, label)
+
+
+    @staticmethod
+    def _apply(db, repo, event, label, color, old_label):
+        if db.execute('UPDATE repos SET pages = ? WHERE repo = ?', ('[]', repo)).rowcount == 0:
+            return
+        if event == 'edited':
+            db.execute('DELETE FROM labels WHERE repo = ? AND key = ?', (repo, old_label.casefold()))
+        if event == 'deleted':
+            db.execute('DELETE FROM labels WHERE repo = ? AND key = ?', (repo, label.casefold()))
+        else:
+            db.execute('INSERT OR REPLACE INTO labels (repo, key, name, color) VALUES (?, ?, ?, ?)',
+                       (repo, label.casefold(), label, color))
@@ -0,0 +1,205 @@
+import collections
+import json
+from .groups import GroupTemplates
+
+
+PLAN_VERSION = 1
+
+
+Renames = collections.namedtuple('Renames', ['mapping', 'by_color'])
+Renames.__doc__ = '''
+Rules for recognizing repository labels which should be renamed to template ones.
+
+:ivar mapping: Dictionary of casefolded old label names as keys and new names as values.
+:ivar by_color: True if a label should be renamed when it's the only unused label of the color of the only missing template label of that color.
+'''
+
+
+class RepoPlan:
+    '''
+    Set of label operations needed to synchronize one repository with the template.
+
+    :ivar repo: Full repository name.
+    :ivar adds: List of tuples of name and color of labels to be added.
+    :ivar updates: List of tuples of current name, new name and new color of labels to be updated.
+    :ivar deletes: List of tuples of name and color of labels to be deleted.
+    :ivar pages: List of tuples of URL and ETag of label listing pages the plan was computed from.
+    '''
+
+    def __init__(self, repo, adds=None, updates=None, deletes=None, pages=None):
+        self.repo = repo
+        self.adds = adds if adds is not None else []
+        self.updates = updates if updates is not None else []
+        self.deletes = deletes if deletes is not None else []
+        self.pages = pages if pages is not None else []
+
+
+    def __len__(self):
+        return len(self.adds) + len(self.updates) + len(self.deletes)
+
+
+    def __repr__(self):
+        return '<RepoPlan {} +{} ~{} -{}>'.format(self.repo, len(self.adds), len(self.updates), len(self.deletes))
+
+
+    def to_dict(self):
+        '''
+        Converts the plan to JSON serializable dictionary.
+
+        :return: Dictionary with repo, adds, updates, deletes and pages keys.
+        '''
+        return {'repo': self.repo, 'adds': self.adds, 'updates': self.updates, 'deletes': self.deletes, 'pages': self.pages}
+
+
+    @classmethod
+    def from_dict(cls, data):
+        '''
+        Creates the plan from dictionary created by :meth:`to_dict`.
+
+        :param data: Dictionary with repo, adds, updates, deletes and pages keys.
+        :return: :class:`RepoPlan` instance.
+        '''
+        return cls(data['repo'],
+                   [tuple(item) for item in data.get('adds', [])],
+                   [tuple(item) for item in data.get('updates', [])],
+                   [tuple(item) for item in data.get('deletes', [])],
+                   [tuple(item) for item in data.get('pages', [])])
+
+
+def label_index(labels):
+    '''
+    Builds case-insensitive index of label names.
+
+    :param labels: Iterable of label names.
+    :return: Dictionary of casefolded label names as keys and original names as values.
+    '''
+    return {label.casefold(): label for label in labels}
+
+
+def load_renames(config):
+    '''
+    Reads rename rules from *[renames]* section (old name = new name) and
+    *rename_by_color* from *[others]* section of the configuration.
+
+    :param config: Config loaded with configparser.
+    :return: :class:`Renames` instance.
+    '''
+    mapping = {old.casefold(): new for old, new in config['renames'].items()} if 'renames' in config else {}
+    return Renames(mapping, config.getboolean('others', 'rename_by_color', fallback=False))
+
+
+def find_renames(missing, unused, repo_labels, renames, replace):
+    '''
+    Pairs template labels missing in the repository with unused repository labels which should be renamed to them.
+
+    Explicit renames are used in both modes, labels are matched by color only
+    in replace mode, where unused labels would be deleted otherwise.
+
+    :param missing: List of tuples of name and color of template labels missing in the repository.
+    :param unused: Dictionary of casefolded names as keys and names as values of repository labels which are not in the template.
+    :param repo_labels: Dictionary of current repository label names as keys and colors as values.
+    :param renames: :class:`Renames` instance.
+    :param replace: True if unused labels are going to be deleted.
+    :return: Dictionary of missing label names as keys and current names of labels to be renamed as values.
+    '''
+    renamed = {}
+    taken = set()
+    sources = {}
+    for old, new in renames.mapping.items():
+        sources.setdefault(new.casefold(), []).append(old)
+    for label, color in missing:
+        for old in sources.get(label.casefold(), []):
+            if old in unused and old not in taken:
+                renamed[label] = unused[old]
+                taken.add(old)
+                break
+    if replace and renames.by_color:
+        left = [(label, color) for label, color in missing if label not in renamed]
+        wanted = collections.Counter(color.lower() for label, color in left)
+        offered = {}
+        for key, name in unused.items():
+            if key not in taken:
+                offered.setdefault(repo_labels[name].lower(), []).append(name)
+        for label, color in left:
+            candidates = offered.get(color.lower(), [])
+            if wanted[color.lower()] == 1 and len(candidates) == 1:
+                renamed[label] = candidates[0]
+    return renamed
+
+
+def compute_plan(repo, labels, repo_labels, replace, renames=None):
+    '''
+    Computes operations needed to synchronize repository labels with the template.
+
+    Labels are matched by name case-insensitively, so a label differing only
+    in the case of its name is updated instead of being deleted and added.
+    With *renames*, labels recognized as renamed (see :func:`find_renames`)
+    are updated too, so they keep their issues and cost one request.
+
+    :param repo: Full repository name.
+    :param labels: Dictionary of template label names as keys and colors as values.
+    :param repo_labels: Dictionary of current repository label names as keys and colors as values.
+    :param replace: True if labels that are not in the template should be deleted.
+    :param renames: :class:`Renames` instance or None if no labels should be renamed.
+    :return: :class:`RepoPlan` instance.
+    '''
+    plan = RepoPlan(repo)
+    index = label_index(repo_labels)
+    template_index = label_index(labels)
+    missing = []
+    for label, color in labels.items():
+        current = index.get(label.casefold())
+        if current is None:
+            missing.append((label, color))
+        elif current != label or repo_labels[current].lower() != color.lower():
+            plan.updates.append((current, label, color))
+    unused = {key: label for key, label in index.items() if key not in template_index}
+    renamed = find_renames(missing, unused, repo_labels, renames, replace) if renames is not None and missing and unused else {}
+    for label, color in missing:
+        if label in renamed:
+            plan.updates.append((renamed[label], label, color))
+        else:
+            plan.adds.append((label, color))
+    if replace:
+        kept = {label.casefold() for label in renamed.values()}
+        plan.deletes = [(label, color) for label, color in repo_labels.items()
+                        if label.casefold() in unused and label.casefold() not in kept]
+    return plan
+
+
+def save_plans(path, replace, labels, plans):
+    '''
+    Saves plans to a JSON file.
+
+    :param path: Path of the file.
+    :param replace: True if plans were computed in replace mode.
+    :param labels: Dictionary of template label names as keys and colors as values or :class:`~labelord.groups.GroupTemplates` instance.
+    :param plans: List of :class:`RepoPlan` instances.
+    '''
+    data = {
+        'version': PLAN_VERSION,
+        'mode': 'replace' if replace else 'update',
+        'labels': labels if not isinstance(labels, GroupTemplates) else {},
+        'repos': [plan.to_dict() for plan in plans],
+    }
+    if isinstance(labels, GroupTemplates):
+        data['groups'] = labels.to_dict()
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def load_plans(path):
+    '''
+    Loads plans saved by :func:`save_plans`.
+
+    :param path: Path of the file.
+    :return: Tuple of True if plans were computed in replace mode, dictionary of template labels
+             (or :class:`~labelord.groups.GroupTemplates` instance) and list of :class:`RepoPlan` instances.
+    :raises ValueError: If the file is not a valid plan file.
+    '''
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get('version') != PLAN_VERSION:
+        raise ValueError('Unsupported plan file version')
+    labels = GroupTemplates.from_dict(data['groups']) if 'groups' in data else data['labels']
+    return data['mode'] == 'replace', labels, [RepoPlan.from_dict(item) for item in data['repos']]
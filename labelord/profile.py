@@ -0,0 +1,143 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Profiler:
+    '''
+    Records timing spans of a run in Chrome trace event format.
+
+    The trace can be opened in *chrome://tracing* or *Perfetto*, spans of
+    every thread are shown on their own track. Can be shared by multiple threads.
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._threads = {}
+        self.events = []
+
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        '''
+        Context manager recording a span of its block.
+
+        :param name: Name of the span.
+        :param category: Category of the span, for example *http*, *api*, *diff* or *wait*.
+        :param args: JSON serializable details of the span, the block can add more to the yielded dictionary.
+        '''
+        begin = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': self.pid, 'tid': thread.ident,
+                     'ts': round((begin - self.start) * 1e6, 3), 'dur': round((end - begin) * 1e6, 3), 'args': args}
+            with self._lock:
+                self._threads.setdefault(thread.ident, thread.name)
+                self.events.append(event)
+
+
+    def trace(self):
+        '''
+        Builds the trace.
+
+        :return: Dictionary in Chrome trace event format.
+        '''
+        with self._lock:
+            names = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                     for tid, name in self._threads.items()]
+            return {'traceEvents': names + list(self.events), 'displayTimeUnit': 'ms'}
+
+
+    def write(self, path):
+        '''
+        Writes the trace to a file.
+
+        :param path: Path of the trace file.
+        '''
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f)
+
+
+    def slowest(self, count=10, category='http'):
+        '''
+        Finds the longest spans of the category.
+
+        :param count: Maximal number of spans.
+        :param category: Category of spans.
+        :return: List of span events sorted from the longest one.
+        '''
+        with self._lock:
+            spans = [event for event in self.events if event['cat'] == category]
+        return sorted(spans, key=lambda event: event['dur'], reverse=True)[:count]
+
+
+    def report(self, count=10):
+        '''
+        Describes total time of every category and the slowest requests.
+
+        :param count: Number of requests to be listed.
+        :return: Human readable report.
+        '''
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                number, duration = totals.get(event['cat'], (0, 0.0))
+                totals[event['cat']] = (number + 1, duration + event['dur'])
+        lines = ['[PROFILE] {} span(s) of {}: {:.1f} ms total'.format(number, category, duration / 1000)
+                 for category, (number, duration) in sorted(totals.items())]
+        for event in self.slowest(count):
+            args = event['args']
+            lines.append('[PROFILE] {:9.1f} ms {} {} ({} ms to headers)'.format(
+                event['dur'] / 1000, args.get('status', '-'), event['name'], args.get('elapsed', '-')))
+        return '\n'.join(lines)
+
+
+class NoSpan:
+    '''
+    Context manager used instead of spans when nothing is profiled.
+    '''
+
+    def __init__(self, args):
+        self.args = args
+
+
+    def __enter__(self):
+        return self.args
+
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+profiler = None
+
+
+def set_profiler(new_profiler):
+    '''
+    Sets the profiler recording spans of :func:`span`.
+
+    :param new_profiler: :class:`Profiler` instance or None to stop profiling.
+    '''
+    global profiler
+    profiler = new_profiler
+
+
+def span(name, category, **args):
+    '''
+    Records a span of the block with the current profiler, does nothing if there's none.
+
+    :param name: Name of the span.
+    :param category: Category of the span.
+    :param args: JSON serializable details of the span.
+    :return: Context manager yielding dictionary of details.
+    '''
+    if profiler is None:
+        return NoSpan(args)
+    return profiler.span(name, category, **args)
@@ -0,0 +1,223 @@
+import random
+import threading
+import time
+import requests
+import urllib.parse
+from . import metrics
+from .profile import span
+from .tokens import TokenAuth
+
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+MUTATING_METHODS = frozenset(['POST', 'PATCH', 'PUT', 'DELETE'])
+SERVER_ERRORS = frozenset([500, 502, 503, 504])
+QUERY_URLS = ('/graphql',)
+
+
+class Scheduler:
+    '''
+    Throttles and retries requests to GitHub API.
+
+    Keeps track of the remaining rate limit budget from *X-RateLimit-* headers,
+    spaces mutating requests to stay under secondary rate limits and retries
+    rate limited requests and idempotent requests failed on server errors
+    with exponential backoff and jitter. Can be shared by multiple threads.
+
+    :ivar requests: Number of requests sent.
+    :ivar retries: Number of requests sent again.
+    :ivar waited: Number of seconds spent waiting.
+    :ivar remaining: Last known remaining rate limit budget or None.
+    :ivar reset: Last known time of rate limit reset in seconds since the epoch or None.
+    :ivar pool: :class:`~labelord.tokens.TokenPool` choosing token of every request or None.
+    '''
+
+    def __init__(self, mutations_per_minute=80, retries=3, backoff=1.0, max_wait=900, reserve=50, pool=None):
+        self.mutation_interval = 60.0 / mutations_per_minute if mutations_per_minute > 0 else 0
+        self.max_retries = retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.reserve = reserve
+        self.requests = 0
+        self.retries = 0
+        self.waited = 0.0
+        self.remaining = None
+        self.reset = None
+        self.pool = pool
+        self.sleep = time.sleep
+        self._lock = threading.Lock()
+        self._next_request = 0.0
+        self._next_mutation = 0.0
+
+
+    @classmethod
+    def from_config(cls, config, pool=None):
+        '''
+        Creates scheduler with settings from *[github]* section of the configuration.
+
+        :param config: Config loaded with configparser.
+        :param pool: :class:`~labelord.tokens.TokenPool` choosing token of every request or None.
+        :return: :class:`Scheduler` instance.
+        '''
+        return cls(mutations_per_minute=config.getint('github', 'mutations_per_minute', fallback=80),
+                   retries=config.getint('github', 'retries', fallback=3),
+                   max_wait=config.getint('github', 'max_wait', fallback=900), pool=pool)
+
+
+    def _wait(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.waited += seconds
+            with span('wait', 'wait', seconds=round(seconds, 3)):
+                self.sleep(seconds)
+
+
+    def acquire(self, method, budget=None):
+        '''
+        Waits until the request can be sent.
+
+        :param method: HTTP method of the request.
+        :param budget: :class:`~labelord.tokens.Token` the request is sent with, budget of the scheduler is used if None.
+        '''
+        budget = budget if budget is not None else self
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request)
+            if budget.remaining is not None and budget.reset is not None and budget.remaining < self.reserve:
+                until_reset = min(max(budget.reset - time.time(), 0), self.max_wait)
+                self._next_request = slot + until_reset / max(budget.remaining, 1)
+            if method in MUTATING_METHODS and self.mutation_interval:
+                slot = max(slot, self._next_mutation)
+                self._next_mutation = slot + self.mutation_interval
+            self.requests += 1
+        self._wait(slot - now)
+
+
+    def update(self, response):
+        '''
+        Updates the rate limit budget from response headers.
+
+        :param response: Response from GitHub API.
+        '''
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        with self._lock:
+            if remaining is not None and remaining.isdigit():
+                self.remaining = int(remaining)
+            if reset is not None and reset.isdigit():
+                self.reset = int(reset)
+
+
+    def retry_delay(self, method, response, attempt):
+        '''
+        Decides if the request should be sent again.
+
+        :param method: HTTP method of the request.
+        :param response: Response from GitHub API.
+        :param attempt: Number of previous attempts.
+        :return: Number of seconds to wait before the retry or None if it shouldn't be retried.
+        '''
+        if attempt >= self.max_retries:
+            return None
+        code = response.status_code
+        jitter = self.backoff * (2 ** attempt) * (0.5 + random.random())
+        if code in (403, 429):
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = int(retry_after)
+            elif response.headers.get('X-RateLimit-Remaining') == '0':
+                delay = max(int(response.headers.get('X-RateLimit-Reset', '0')) - time.time(), 0) + 1
+            elif code == 429 or 'rate limit' in response.text.lower():
+                delay = jitter
+            else:
+                return None
+            return delay if delay <= self.max_wait else None
+        if code in SERVER_ERRORS and method in IDEMPOTENT_METHODS:
+            return jitter
+        return None
+
+
+    def send(self, send, method, url, **kwargs):
+        '''
+        Sends the request with throttling and retries.
+
+        :param send: Function sending the request.
+        :param method: HTTP method of the request.
+        :param url: URL of the request.
+        :return: Response from GitHub API.
+        '''
+        method = request_method = method.upper()
+        if method == 'POST' and url.endswith(QUERY_URLS):
+            # GraphQL queries only read, so they are throttled and retried like GET requests
+            method = 'GET'
+        token = self.pool.choose(url) if self.pool is not None else None
+        attempt = 0
+        while True:
+            self.acquire(method, token)
+            if token is not None:
+                kwargs['auth'] = TokenAuth(token.value)
+            try:
+                response = send(request_method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            else:
+                self.update(response)
+                if token is not None and self.pool.update(token, url, response):
+                    # another token can serve the request right away
+                    response.close()
+                    token = self.pool.choose(url)
+                    with self._lock:
+                        self.retries += 1
+                    continue
+                delay = self.retry_delay(method, response, attempt)
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            self._wait(delay)
+
+
+    def summary(self):
+        '''
+        Describes counters of the scheduler.
+
+        :return: Human readable summary.
+        '''
+        text = '{} request(s) sent, {} retried, {:.1f} s waited'.format(self.requests, self.retries, self.waited)
+        if self.pool is not None:
+            text += ', ' + self.pool.summary()
+        elif self.remaining is not None:
+            text += ', {} remaining in rate limit'.format(self.remaining)
+        return text
+
+
+class ScheduledSession(requests.Session):
+    '''
+    Session sending all requests through a :class:`Scheduler`.
+
+    :ivar timeout: Default timeout of requests in seconds or None.
+    '''
+
+    def __init__(self, scheduler=None, timeout=None):
+        super().__init__()
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.timeout = timeout
+
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.scheduler.send(self._send, method, url, **kwargs)
+
+
+    def _send(self, method, url, **kwargs):
+        phase = 'fetch' if method in ('GET', 'HEAD') or url.endswith(QUERY_URLS) else 'mutate'
+        with metrics.registry.timer('labelord_phase_seconds', phase=phase), \
+                span('{} {}'.format(method, urllib.parse.urlsplit(url).path), 'http', url=url) as details:
+            response = super().request(method, url, **kwargs)
+            details['status'] = response.status_code
+            details['elapsed'] = round(response.elapsed.total_seconds() * 1000, 1)
+        metrics.registry.inc('labelord_requests_total', method=method, code=str(response.status_code))
+        return response
@@ -0,0 +1,96 @@
+import os
+import signal
+import socket
+import sys
+import time
+import werkzeug.serving
+
+
+def listen(host, port, backlog=128):
+    '''
+    Opens listening socket shared by worker processes.
+
+    :param host: Hostname.
+    :param port: Port.
+    :param backlog: Maximal number of connections waiting to be accepted.
+    :return: Listening socket.
+    '''
+    info = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    sock = socket.socket(info[0], socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(info[4])
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn(app, host, port, sock, on_start=None):
+    '''
+    Forks a worker process serving requests from the shared socket.
+
+    :return: Process ID of the worker.
+    '''
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        if on_start is not None:
+            on_start()
+        server = werkzeug.serving.make_server(host, port, app, threaded=True, fd=sock.fileno())
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def serve(app, host, port, workers, on_start=None, on_exit=None):
+    '''
+    Serves the WSGI application by a pool of pre-forked worker processes.
+
+    All workers accept connections from one listening socket, each of them
+    handles requests by threads. Workers which die are started again, the
+    pool is stopped by *SIGINT* or *SIGTERM*. Works only on POSIX systems.
+
+    :param app: WSGI application.
+    :param host: Hostname.
+    :param port: Port.
+    :param workers: Number of worker processes.
+    :param on_start: Function called in every worker process before it starts serving.
+    :param on_exit: Function called with process ID of a worker which exited, before another one is started instead of it.
+    '''
+    sock = listen(host, port)
+    print(' * Running on http://{}:{}/ with {} worker processes'.format(host, sock.getsockname()[1], workers), file=sys.stderr)
+    children = set()
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while True:
+            while len(children) < workers:
+                children.add(spawn(app, host, port, sock, on_start))
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                continue
+            children.discard(pid)
+            if on_exit is not None:
+                on_exit(pid)
+            # don't restart crashing workers in a tight loop
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
@@ -0,0 +1,98 @@
+import requests
+import requests.adapters
+import urllib3.connection
+import urllib3.connectionpool
+from .cache import CachingAdapter
+from .helpers import API_URL
+from .profile import span
+from .scheduler import Scheduler, ScheduledSession
+from .tokens import TokenAuth, TokenPool
+
+
+class ProfiledConnection:
+    '''
+    Mixin of urllib3 connections recording their setup as spans of the current profiler.
+
+    A *connect* span covers the whole setup of a new connection including TLS handshake,
+    a *tcp* span inside it covers name resolution and TCP handshake only.
+    '''
+
+    def connect(self):
+        with span('connect {}'.format(self.host), 'connect', host=self.host, port=self.port):
+            return super().connect()
+
+
+    def _new_conn(self):
+        with span('tcp {}'.format(self.host), 'tcp', host=self.host, port=self.port):
+            return super()._new_conn()
+
+
+class ProfiledHTTPConnection(ProfiledConnection, urllib3.connection.HTTPConnection):
+    pass
+
+
+class ProfiledHTTPSConnection(ProfiledConnection, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class ProfiledHTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    ConnectionCls = ProfiledHTTPConnection
+
+
+class ProfiledHTTPSConnectionPool(urllib3.connectionpool.HTTPSConnectionPool):
+    ConnectionCls = ProfiledHTTPSConnection
+
+
+def profile_connections(adapter):
+    '''
+    Makes the transport adapter record setup of new connections with :func:`~labelord.profile.span`.
+
+    :param adapter: :class:`requests.adapters.HTTPAdapter` instance.
+    :return: The adapter.
+    '''
+    adapter.poolmanager.pool_classes_by_scheme = {'http': ProfiledHTTPConnectionPool, 'https': ProfiledHTTPSConnectionPool}
+    return adapter
+
+
+def configure_session(session, token, user_agent):
+    '''
+    Sets headers and authentication of the session.
+
+    :param session: Session to be configured.
+    :param token: GitHub access token.
+    :param user_agent: Value of User-Agent header.
+    :return: The configured session.
+    '''
+    session.headers.update({'User-Agent': user_agent, 'Accept': 'application/vnd.github.v3+json'})
+    session.auth = TokenAuth(token)
+    return session
+
+
+def create_session(token, user_agent, config, cache=None, pool_size=10):
+    '''
+    Creates session for communication with GitHub API.
+
+    All requests go through a :class:`~labelord.scheduler.Scheduler` set up from
+    the configuration, connections to GitHub are kept alive in a pool of
+    *pool_size* connections, so the session should be shared by all threads.
+    If the configuration contains more tokens, requests are distributed among
+    them by a :class:`~labelord.tokens.TokenPool`.
+
+    :param token: GitHub access token.
+    :param user_agent: Value of User-Agent header.
+    :param config: Config loaded with configparser, *timeout* in *[github]* section is timeout of requests in seconds,
+                   *api_url* is URL of GitHub API.
+    :param cache: :class:`~labelord.cache.ResponseCache` to be used or None.
+    :param pool_size: Maximal number of kept connections.
+    :return: :class:`~labelord.scheduler.ScheduledSession` instance.
+    '''
+    pool = TokenPool.from_config(config, token)
+    session = ScheduledSession(Scheduler.from_config(config, pool if len(pool) > 1 else None))
+    session.timeout = config.getfloat('github', 'timeout', fallback=30)
+    session.api_url = config.get('github', 'api_url', fallback=API_URL).rstrip('/') + '/'
+    if cache is not None:
+        adapter = CachingAdapter(cache, pool_maxsize=pool_size)
+    else:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    session.mount(session.api_url, profile_connections(adapter))
+    return configure_session(session, token, user_agent)
@@ -0,0 +1,217 @@
+import re
+import requests.auth
+import threading
+import time
+
+
+REPO_URL = re.compile(r'/repos/([^/]+)/([^/?#]+)')
+LISTING_URL = re.compile(r'/repos/[^/]+/[^/?#]+(?:/labels)?/?(?:[?#]|$)')
+
+
+class TokenAuth(requests.auth.AuthBase):
+    '''
+    Authenticates requests with GitHub access token.
+
+    :param token: GitHub access token.
+    '''
+
+    def __init__(self, token):
+        self.token = token
+
+
+    def __call__(self, request):
+        request.headers['Authorization'] = 'token ' + self.token
+        return request
+
+
+class Token:
+    '''
+    GitHub token of a :class:`TokenPool` with its rate limit budget.
+
+    :param value: GitHub access token.
+    :param owners: Frozenset of repository owners the token can be used for, None for all.
+    :ivar remaining: Last known remaining rate limit budget or None.
+    :ivar reset: Last known time of rate limit reset in seconds since the epoch or None.
+    '''
+
+    def __init__(self, value, owners=None):
+        self.value = value
+        self.owners = owners
+        self.remaining = None
+        self.reset = None
+        self.disabled = False
+
+
+    def __repr__(self):
+        return '<Token ...{} remaining={}>'.format(self.value[-4:], self.remaining)
+
+
+def repository_of(url):
+    '''
+    Finds out which repository the request URL belongs to.
+
+    :param url: URL of GitHub API request.
+    :return: Full repository name or None if the URL doesn't belong to a repository.
+    '''
+    match = REPO_URL.search(url)
+    return '{}/{}'.format(match.group(1), match.group(2)) if match else None
+
+
+def is_repository_url(url):
+    '''
+    Checks if the URL points to a repository or its label listing, where 404 means no access.
+
+    :param url: URL of GitHub API request.
+    :return: True if the URL points to the repository or its labels, False otherwise.
+    '''
+    return LISTING_URL.search(url) is not None
+
+
+class TokenPool:
+    '''
+    Distributes requests of repositories among several GitHub tokens.
+
+    Every repository sticks to one token, so responses stay cached and
+    requests are spread evenly. A repository is moved to another token when
+    its token runs low on rate limit budget or turns out to have no access
+    to the repository. Can be shared by multiple threads.
+
+    :param tokens: List of :class:`Token` instances, the first one is used for requests not belonging to any repository.
+    :param reserve: Rate limit budget under which the token is avoided until its reset.
+    '''
+
+    def __init__(self, tokens, reserve=50):
+        self.tokens = list(tokens)
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        self._assigned = {}
+        self._denied = set()
+
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+    @classmethod
+    def from_config(cls, config, token):
+        '''
+        Creates pool of tokens from the configuration.
+
+        Tokens are taken from *token* argument, whitespace or comma separated *tokens*
+        in *[github]* section and *[tokens]* section mapping repository owners to their
+        tokens (for example GitHub App installation tokens of organizations).
+
+        :param config: Config loaded with configparser.
+        :param token: Main GitHub token, used for requests not belonging to any repository.
+        :return: :class:`TokenPool` instance.
+        '''
+        tokens = [Token(token)] if token else []
+        for value in re.split(r'[\s,]+', config.get('github', 'tokens', fallback='')):
+            if value and value != token:
+                tokens.append(Token(value))
+        if 'tokens' in config:
+            for owner, values in config['tokens'].items():
+                for value in re.split(r'[\s,]+', values):
+                    if value:
+                        tokens.append(Token(value, frozenset([owner.casefold()])))
+        return cls(tokens)
+
+
+    def exhausted(self, token, now=None):
+        '''
+        Checks if the token should be avoided because of its rate limit.
+
+        :param token: :class:`Token` instance.
+        :param now: Current time in seconds since the epoch.
+        :return: True if the token is low on budget and its limit hasn't been reset yet.
+        '''
+        now = time.time() if now is None else now
+        return token.remaining is not None and token.remaining < self.reserve and (token.reset or 0) > now
+
+
+    def choose(self, url):
+        '''
+        Chooses token for the request.
+
+        :param url: URL of the request.
+        :return: :class:`Token` instance.
+        '''
+        repo = repository_of(url)
+        with self._lock:
+            if repo is None:
+                active = [token for token in self.tokens if not token.disabled]
+                return active[0] if active else self.tokens[0]
+            now = time.time()
+            owner = repo.split('/')[0].casefold()
+            candidates = [token for token in self.tokens if not token.disabled and (repo, token.value) not in self._denied
+                          and (token.owners is None or owner in token.owners)]
+            if not candidates:
+                return self._assigned.get(repo, self.tokens[0])
+            current = self._assigned.get(repo)
+            if current in candidates and not self.exhausted(current, now):
+                return current
+            fresh = [token for token in candidates if not self.exhausted(token, now)]
+            if fresh:
+                # prefer tokens dedicated to the owner, then the biggest known budget
+                chosen = max(fresh, key=lambda token: (token.owners is not None,
+                                                        token.remaining if token.remaining is not None else float('inf')))
+            else:
+                chosen = min(candidates, key=lambda token: token.reset or 0)
+            self._assigned[repo] = chosen
+            return chosen
+
+
+    def update(self, token, url, response):
+        '''
+        Updates the pool with the response to a request sent with the token.
+
+        Invalid tokens are disabled, tokens without access to the repository
+        aren't used for it anymore and rate limited tokens are avoided until their reset.
+
+        :param token: :class:`Token` the request was sent with.
+        :param url: URL of the request.
+        :param response: Response from GitHub API.
+        :return: True if the request should be sent again with another token, False otherwise.
+        '''
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        code = response.status_code
+        repo = repository_of(url)
+        rate_limited = code == 429 or code == 403 and (remaining == '0' or 'rate limit' in response.text.lower())
+        with self._lock:
+            if remaining is not None and remaining.isdigit():
+                token.remaining = int(remaining)
+            if reset is not None and reset.isdigit():
+                token.reset = int(reset)
+            if code == 401:
+                token.disabled = True
+            elif rate_limited:
+                token.remaining = min(token.remaining or 0, self.reserve - 1)
+                if (token.reset or 0) <= time.time():
+                    token.reset = int(time.time()) + 60
+            elif repo is not None and (code == 403 or code == 404 and is_repository_url(url)):
+                self._denied.add((repo, token.value))
+            else:
+                return False
+            if repo is not None and self._assigned.get(repo) is token:
+                del self._assigned[repo]
+            owner = repo.split('/')[0].casefold() if repo is not None else None
+            return any(not other.disabled and not self.exhausted(other) and (repo, other.value) not in self._denied
+                       and (other.owners is None or owner in other.owners) for other in self.tokens if other is not token)
+
+
+    def summary(self):
+        '''
+        Describes the pool.
+
+        :return: Human readable summary.
+        '''
+        with self._lock:
+            known = [token.remaining for token in self.tokens if token.remaining is not None and not token.disabled]
+            disabled = sum(token.disabled for token in self.tokens)
+        text = '{} token(s) in pool'.format(len(self.tokens))
+        if disabled:
+            text += ', {} disabled'.format(disabled)
+        if known:
+            text += ', {} remaining in total'.format(sum(known))
+        return text
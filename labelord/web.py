@@ -1,22 +1,108 @@
+import collections
 import flask
 import os
+import concurrent.futures
 import configparser
 import json
+import threading
+import time
 from .helpers import *
 from .github import *
+from .cache import default_directory
+from .coalesce import Coalescer
+from .dedup import MemoryDedupStore, SQLiteDedupStore
+from .jobs import JobQueue, MemoryJobStore, SQLiteJobStore
+from .metrics import registry
+from .mirror import LabelMirror
+from .session import configure_session, create_session
+
+
+ConfigSnapshot = collections.namedtuple('ConfigSnapshot', ['config', 'repos', 'repo_set', 'token', 'tokens', 'secret', 'mtime'])
+ConfigSnapshot.__doc__ = '''
+Immutable view of the configuration used by the web application.
+
+:ivar config: Config loaded with configparser.
+:ivar repos: Tuple of enabled repositories in order of the configuration file.
+:ivar repo_set: Frozenset of enabled repositories.
+:ivar token: GitHub token.
+:ivar tokens: Tuple of additional tokens of the token pool and tuple of owners with their tokens.
+:ivar secret: Webhook secret.
+:ivar mtime: Modification time of the configuration file or None if it shouldn't be watched.
+'''
+
+
+CONFIG_CHECK_INTERVAL = 1.0
+
+
+def make_snapshot(config, mtime=None):
+    '''
+    Precomputes values needed to handle requests from the configuration.
+
+    :param config: Config loaded with configparser.
+    :param mtime: Modification time of the configuration file or None.
+    :return: :class:`ConfigSnapshot` instance.
+    '''
+    repos = tuple(repo for repo in config['repos'] if config['repos'].getboolean(repo)) if 'repos' in config else ()
+    tokens = (config.get('github', 'tokens', fallback=''), tuple(config['tokens'].items()) if 'tokens' in config else ())
+    return ConfigSnapshot(config, repos, frozenset(repos), config.get('github', 'token', fallback=''), tokens,
+                          config.get('github', 'webhook_secret', fallback=''), mtime)
+
+
+def read_config(configpath):
+    '''
+    Reads the configuration file.
+
+    :param configpath: Path of the configuration file.
+    :return: Tuple of config loaded with configparser and modification time of the file or None if it doesn't exist.
+    '''
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    try:
+        mtime = os.stat(configpath).st_mtime
+    except OSError:
+        mtime = None
+    config.read(configpath)
+    return config, mtime
 
 
 class LabelordWeb(flask.Flask):
     '''
     Base Flask class.
+
+    Configuration is kept in an immutable :class:`ConfigSnapshot`, which is
+    replaced as a whole when the configuration file changes. When the app is
+    served by multiple processes (*shared_state* is set), events and jobs
+    are kept in SQLite databases shared by all of them.
     '''
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.lblconfig = None
+        self.snapshot = None
+        self.configpath = os.getenv('LABELORD_CONFIG') or './config.cfg'
+        self.config_checked = 0.0
         self.ghsession = None
-        self.lastlabel = None
-        self.lastaction = None
+        self.ghsession_owned = False
+        self.dedupstore = None
+        self.coalescer = None
+        self.jobqueue = None
+        self.mirror = None
+        self.mirror_loaded = False
+        self.shared_state = False
+        self.state_lock = threading.Lock()
+        self.ghsession_lock = threading.Lock()
+
+
+    @property
+    def lblconfig(self):
+        '''
+        Config loaded with configparser, setting it replaces the snapshot and stops watching of the configuration file.
+        '''
+        return self.snapshot.config if self.snapshot else None
+
+
+    @lblconfig.setter
+    def lblconfig(self, config):
+        self.snapshot = make_snapshot(config) if config is not None else None
 
 
     def inject_session(self, session):
@@ -25,26 +111,218 @@ class LabelordWeb(flask.Flask):
 
         :param session: Session to be used.
         '''
-        session.headers = {'User-Agent': 'mi-pyt-02-labelord'}
-        github_token = self.lblconfig['github'].get('token', '')
-        def token_auth(req):
-            req.headers['Authorization'] = 'token ' + github_token
-            return req
-        session.auth = token_auth
-        self.ghsession = session
+        self.ghsession = configure_session(session, self.lblconfig['github'].get('token', ''), 'mi-pyt-02-labelord')
+        self.ghsession_owned = False
+
+
+    def get_session(self):
+        '''
+        Gets the session to be used for communication with GitHub.
+
+        If no session has been injected, a new one is created on first use and
+        shared by all following webhooks, so connections to GitHub are reused.
+        Its pool keeps a connection for every thread of every worker.
+
+        :return: Session to be used.
+        '''
+        snapshot = self.current_snapshot()
+        with self.ghsession_lock:
+            if not self.ghsession:
+                if not snapshot.token:
+                    error(3, 'No GitHub token has been provided')
+                concurrency = max(snapshot.config.getint('github', 'concurrency', fallback=8), 1)
+                # every worker thread propagates its job to up to concurrency repositories at once
+                workers = max(snapshot.config.getint('server', 'workers', fallback=2), 1)
+                self.ghsession = create_session(snapshot.token, 'mi-pyt-02-labelord', snapshot.config, pool_size=workers * concurrency)
+                self.ghsession_owned = True
+            return self.ghsession
 
 
     def reload_config(self):
         '''
         Reloads the configuration file.
         '''
-        self.lblconfig = configparser.ConfigParser()
-        self.lblconfig.optionxform = str
-        configpath = os.getenv('LABELORD_CONFIG')
-        if configpath is None:
-            configpath = './config.cfg'
-        self.lblconfig.read(configpath)
-        check_config(self.lblconfig)
+        config, mtime = read_config(self.configpath)
+        check_config(config)
+        self.swap_snapshot(make_snapshot(config, mtime))
+
+
+    def swap_snapshot(self, snapshot):
+        '''
+        Replaces the configuration snapshot, drops own session if tokens have changed.
+
+        :param snapshot: New :class:`ConfigSnapshot`.
+        '''
+        old = self.snapshot
+        self.snapshot = snapshot
+        if old is not None and (old.token, old.tokens) != (snapshot.token, snapshot.tokens):
+            with self.ghsession_lock:
+                if self.ghsession_owned:
+                    self.ghsession = None
+
+
+    def current_snapshot(self):
+        '''
+        Gets the configuration snapshot, reloads the configuration file if it has changed.
+
+        The file is checked at most once per :data:`CONFIG_CHECK_INTERVAL` seconds and only
+        if the configuration was read from it. Invalid configuration is reported and ignored.
+
+        :return: :class:`ConfigSnapshot` instance.
+        '''
+        snapshot = self.snapshot
+        now = time.monotonic()
+        if snapshot is None or snapshot.mtime is None or now - self.config_checked < CONFIG_CHECK_INTERVAL:
+            return snapshot
+        self.config_checked = now
+        try:
+            mtime = os.stat(self.configpath).st_mtime
+        except OSError:
+            return snapshot
+        if mtime == snapshot.mtime:
+            return snapshot
+        config, mtime = read_config(self.configpath)
+        problem = config_problem(config)
+        if problem:
+            error(0, 'Configuration not reloaded: {}'.format(problem[1]))
+            self.snapshot = snapshot._replace(mtime=mtime)
+            return snapshot
+        self.swap_snapshot(make_snapshot(config, mtime))
+        return self.snapshot
+
+
+    def state_path(self, name):
+        '''
+        Gets path of SQLite database with state of the server.
+
+        The path is taken from *name* option in *[server]* section of the configuration.
+        If it's not set and the state is shared by multiple processes, a database in
+        *state_directory* (*server* in the cache directory by default) is used.
+
+        :param name: Name of the state, *dedup* or *queue*.
+        :return: Path of the database or empty string if the state should be kept in memory.
+        '''
+        path = self.lblconfig.get('server', name, fallback='')
+        if path or not self.shared_state:
+            return path
+        directory = self.lblconfig.get('server', 'state_directory', fallback='') or os.path.join(default_directory(), 'server')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name + '.sqlite')
+
+
+    def prepare_workers(self):
+        '''
+        Prepares state shared by worker processes, called once before they are started.
+
+        Jobs interrupted by the previous run of the server are queued again.
+        No connection is kept open, so nothing is inherited by the workers.
+        '''
+        self.shared_state = True
+        if self.lblconfig.getint('server', 'workers', fallback=2) > 0:
+            SQLiteJobStore(self.state_path('queue')).requeue_running()
+
+
+    def start_worker(self):
+        '''
+        Starts background processing of jobs in a worker process.
+
+        Jobs left queued by other (possibly crashed) processes are picked up as well.
+        '''
+        if self.lblconfig.getint('server', 'workers', fallback=2) > 0:
+            self.get_job_queue()
+
+
+    def worker_exited(self, pid):
+        '''
+        Queues again jobs which were running in a worker process which exited.
+
+        Called by the parent process before another worker is started, which picks them up.
+
+        :param pid: Process ID of the worker.
+        '''
+        if self.lblconfig.getint('server', 'workers', fallback=2) > 0:
+            SQLiteJobStore(self.state_path('queue')).requeue_running(pid)
+
+
+    def get_dedup_store(self):
+        '''
+        Gets the store of recently received events, creates it on first use.
+
+        Events are kept in SQLite database *dedup* from *[server]* section of
+        the configuration if it's set, so they can be shared by multiple processes.
+
+        :return: :class:`~labelord.dedup.MemoryDedupStore` or :class:`~labelord.dedup.SQLiteDedupStore` instance.
+        '''
+        with self.state_lock:
+            if self.dedupstore is None:
+                path = self.state_path('dedup')
+                self.dedupstore = SQLiteDedupStore(path) if path else MemoryDedupStore()
+            return self.dedupstore
+
+
+    def get_coalescer(self):
+        '''
+        Gets the coalescer of label events, creates it on first use.
+
+        Events are buffered for *coalesce_window* seconds from *[server]* section
+        of the configuration and their net changes are queued as a single job.
+        With no *workers*, the job is done right away by the thread of the coalescer.
+
+        :return: :class:`~labelord.coalesce.Coalescer` instance.
+        '''
+        with self.state_lock:
+            if self.coalescer is None:
+                window = self.lblconfig.getfloat('server', 'coalesce_window', fallback=0)
+                self.coalescer = Coalescer(self.flush_changes, window)
+            return self.coalescer
+
+
+    def flush_changes(self, changes):
+        '''
+        Propagates net changes of coalesced events to all repositories.
+
+        :param changes: List of changes computed by :func:`~labelord.coalesce.coalesce`.
+        '''
+        payload = {'changes': changes, 'repos': list(self.current_snapshot().repos)}
+        if self.lblconfig.getint('server', 'workers', fallback=2) == 0:
+            process_job(payload)
+        else:
+            self.get_job_queue().submit(payload)
+
+
+    def get_job_queue(self):
+        '''
+        Gets the queue of webhook jobs, creates it on first use.
+
+        Number of worker threads is taken from *workers* in *[server]* section
+        of the configuration, jobs are kept in SQLite database *queue* if it's set.
+        Finished jobs are removed after *job_retention* seconds or when there
+        are more than *job_history* of them.
+
+        :return: :class:`~labelord.jobs.JobQueue` instance.
+        '''
+        with self.state_lock:
+            if self.jobqueue is None:
+                path = self.state_path('queue')
+                store = SQLiteJobStore(path) if path else MemoryJobStore()
+                workers = self.lblconfig.getint('server', 'workers', fallback=2)
+                retention = self.lblconfig.getint('server', 'job_retention', fallback=86400)
+                history = self.lblconfig.getint('server', 'job_history', fallback=1000)
+                self.jobqueue = JobQueue(process_job, store, workers, recover=not self.shared_state, retention=retention, history=history)
+            return self.jobqueue
+
+
+    def get_mirror(self):
+        '''
+        Gets the mirror of repository labels, opens it on first use.
+
+        :return: :class:`~labelord.mirror.LabelMirror` instance or None if the mirror is turned off.
+        '''
+        with self.state_lock:
+            if not self.mirror_loaded:
+                self.mirror = LabelMirror.from_config(self.lblconfig, default_directory())
+                self.mirror_loaded = True
+            return self.mirror
 
 
 def create_app():
@@ -54,12 +332,7 @@ def create_app():
     :return: Flask app instance.
     '''
     app = LabelordWeb(__name__)
-    app.lblconfig = configparser.ConfigParser()
-    app.lblconfig.optionxform = str
-    configpath = os.getenv('LABELORD_CONFIG')
-    if configpath is None:
-        configpath = './config.cfg'
-    app.lblconfig.read(configpath)
+    app.snapshot = make_snapshot(*read_config(app.configpath))
     return app
 
 
@@ -67,23 +340,20 @@ def load_repos():
     '''
     Loads repositories from the configuration.
 
-    :return: Array of full repositories names set up in configuration file.
+    :return: Tuple of full repositories names set up in configuration file.
     '''
-    config = app.lblconfig
-    return [repo for repo in config['repos'] if config['repos'].getboolean(repo)]
+    return app.current_snapshot().repos
 
 
-def check_request(request):
+def check_request(json_data, snapshot):
     '''
     Checks if incoming request is valid.
 
-    :param request: Request to be checked.
+    :param json_data: Parsed payload of the request.
+    :param snapshot: :class:`ConfigSnapshot` to check the request against.
     :return: True if request is valid, False otherwise.
     '''
-    json_data = json.loads(request.data)
-    repo = json_data['repository']['full_name']
-    repos = load_repos()
-    return repo in repos
+    return json_data['repository']['full_name'] in snapshot.repo_set
 
 
 def get():
@@ -97,26 +367,61 @@ def get():
 def post():
     '''
     Method to be run after received POST request.
+
+    Synchronization is queued and done in background, the request is answered
+    with 202 status code immediately. If *workers* in *[server]* section of
+    the configuration is 0, synchronization is done before responding.
     '''
-    if not verify_signature(flask.request, app):
+    snapshot = app.current_snapshot()
+    if not verify_signature(flask.request, snapshot.secret):
+        registry.inc('labelord_webhooks_total', outcome='unauthorized')
         return flask.make_response('UNAUTHORIZED', 401)
-    elif not check_request(flask.request):
+    json_data = json.loads(flask.request.data)
+    if not check_request(json_data, snapshot):
+        registry.inc('labelord_webhooks_total', outcome='rejected')
         return flask.make_response('BAD REQUEST', 400)
-    if is_redundant(app):
+    ttl = snapshot.config.getint('server', 'dedup_ttl', fallback=120)
+    if is_redundant(app.get_dedup_store(), json_data, flask.request.headers.get('X-GitHub-Delivery', ''), ttl):
+        registry.inc('labelord_webhooks_total', outcome='redundant')
         return flask.make_response('OK', 200)
-    repos = load_repos()
-    json_data = json.loads(flask.request.data)
     original_repo = json_data['repository']['full_name']
     event = json_data['action']
-    todo_repos = list(filter(lambda x: x != original_repo, repos))
     label = json_data['label']['name']
     color = json_data['label']['color']
     old_label = ''
-    if event == 'edited' and json_data.get('changes', '').get('name', ''):
-        old_label = json_data.get('changes', '').get('name', '').get('from', '')
+    if event == 'edited' and json_data.get('changes', {}).get('name', {}):
+        old_label = json_data['changes']['name'].get('from', '')
     else:
         old_label = label
-    return sync_labels(event, todo_repos, label, color, old_label)
+    mirror = app.get_mirror()
+    if mirror is not None:
+        mirror.apply_change(original_repo, event, label, color, old_label)
+    if snapshot.config.getfloat('server', 'coalesce_window', fallback=0) > 0:
+        app.get_coalescer().add(event, label, color, old_label, original_repo)
+        registry.inc('labelord_webhooks_total', outcome='coalesced')
+        return flask.make_response('ACCEPTED', 202)
+    change = {'event': event, 'label': label, 'color': color, 'old_label': old_label, 'skip': [original_repo]}
+    payload = {'changes': [change], 'repos': list(snapshot.repos)}
+    if snapshot.config.getint('server', 'workers', fallback=2) == 0:
+        process_job(payload)
+        registry.inc('labelord_webhooks_total', outcome='done')
+        return flask.make_response('OK', 200)
+    job_id = app.get_job_queue().submit(payload)
+    registry.inc('labelord_webhooks_total', outcome='queued')
+    response = flask.make_response('ACCEPTED', 202)
+    response.headers['Location'] = flask.url_for('job', job_id=job_id)
+    return response
+
+
+def process_job(payload):
+    '''
+    Performs a webhook job.
+
+    :param payload: Dictionary with changes and repos arguments of :func:`sync_changes`.
+    :return: List of dictionaries with repo, label, code and message of every operation.
+    '''
+    with registry.timer('labelord_job_seconds'):
+        return sync_changes(payload['changes'], payload['repos'])
 
 
 def sync_labels(event, repos, label, color, old_label):
@@ -128,31 +433,62 @@ def sync_labels(event, repos, label, color, old_label):
     :param label: Label name that should be synchronized.
     :param color: Label color that should be synchronized.
     :param old_label: Name of the old label that should be updated.
+    :return: List of dictionaries with repo, label, code and message of every operation.
+    '''
+    return sync_changes([{'event': event, 'label': label, 'color': color, 'old_label': old_label, 'skip': []}], repos)
+
+
+def sync_changes(changes, repos):
+    '''
+    Synchronizes defined repositories with given changes of labels.
+
+    Repositories are processed concurrently, changes of one repository are done in order.
+
+    :param changes: List of dictionaries with event, label, color, old_label and skip keys,
+                    skip is a list of repositories the change shouldn't be done in.
+    :param repos: Full repositories names that should be synchronized.
+    :return: List of dictionaries with repo, label, code and message of every operation.
+    '''
+    concurrency = max(app.current_snapshot().config.getint('github', 'concurrency', fallback=8), 1)
+    session = app.get_session()
+    mirror = app.get_mirror()
+    def worker(repo):
+        outcomes = []
+        for change in changes:
+            if repo in change['skip']:
+                continue
+            outcome = sync_repo(session, change['event'], repo, change['label'], change['color'], change['old_label'])
+            if mirror is not None:
+                if 200 <= outcome['code'] < 300:
+                    mirror.apply_change(repo, change['event'], change['label'], change['color'], change['old_label'])
+                else:
+                    mirror.forget(repo)
+            outcomes.append(outcome)
+        return outcomes
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return [outcome for outcomes in executor.map(worker, repos) for outcome in outcomes]
+
+
+def sync_repo(session, event, repo, label, color, old_label):
+    '''
+    Synchronizes one repository with given label.
+
+    :param session: Session to use for communication with GitHub API.
+    :param event: String describing event, can be *created*, *edited* or *deleted*.
+    :param repo: Full repository name that should be synchronized.
+    :param label: Label name that should be synchronized.
+    :param color: Label color that should be synchronized.
+    :param old_label: Name of the old label that should be updated.
+    :return: Dictionary with repo, label, code and message of the operation.
     '''
-    session = app.ghsession
-    if not session:
-        session = requests.Session()
-        session.headers = {'User-Agent': 'mi-pyt-02-labelord'}
-        github_token = app.lblconfig['github']['token']
-        if not github_token:
-            error(3, 'No GitHub token has been provided')
-        def token_auth(req):
-            req.headers['Authorization'] = 'token ' + github_token
-            return req
-        session.auth = token_auth
     if event == 'created':
-        for repo in repos:
-            data = {"name": label, "color": color}
-            code, msg = add_label(session, repo, data)
+        code, msg = add_label(session, repo, {"name": label, "color": color})
     elif event == 'edited':
-        for repo in repos:
-            data = {"name": label, "color": color}
-            code, msg = update_label(session, repo, old_label, data)
+        code, msg = update_label(session, repo, old_label, {"name": label, "color": color})
     else:
         # deleted
-        for repo in repos:
-            code, msg = delete_label(session, repo, label)
-    return flask.make_response('OK', 200)
+        code, msg = delete_label(session, repo, label)
+    return {'repo': repo, 'label': label, 'code': code, 'message': msg}
 
 
 app = create_app()
@@ -176,3 +512,26 @@ def respond():
     else:
         return flask.make_response('BAD REQUEST', 400)
 
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def job(job_id):
+    '''
+    Flask respond method with status and outcome of a webhook job.
+    '''
+    job = app.get_job_queue().store.get(job_id)
+    if job is None:
+        return flask.make_response('NOT FOUND', 404)
+    return flask.jsonify(job)
+
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    '''
+    Flask respond method with metrics in Prometheus text format, enabled by *metrics* in *[server]* section.
+    '''
+    if not app.current_snapshot().config.getboolean('server', 'metrics', fallback=False):
+        return flask.make_response('NOT FOUND', 404)
+    response = flask.make_response(registry.render(), 200)
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response